@@ -0,0 +1,70 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingAlbum:
+    __slots__ = ("items", "first_at", "last_at", "closed")
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.first_at = self.last_at = time.monotonic()
+        self.closed = asyncio.Event()  # Set to flush before the window is over
+
+
+class AlbumCollector:
+    """Groups the messages of a media group (album) and hands them over as one batch.
+
+    Telegram delivers an album as separate updates sharing ``media_group_id``. Each one is
+    added here and its handler returns at once, so the user's following updates aren't held
+    up. ALBUM_COLLECT_WINDOW seconds after the latest item arrived (ALBUM_MAX_WAIT after the
+    first at most), ``on_album`` runs in a background task with all items in arrival order.
+    """
+
+    def __init__(self, on_album: Callable[[List[Any]], Awaitable[None]]):
+        self.on_album = on_album
+        self.window = float(os.getenv('ALBUM_COLLECT_WINDOW', 1.0))
+        self.max_wait = float(os.getenv('ALBUM_MAX_WAIT', 5.0))
+        self._pending: Dict[Hashable, _PendingAlbum] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, key: Hashable, item: Any):
+        album = self._pending.get(key)
+        if album is None:
+            album = self._pending[key] = _PendingAlbum()
+            task = asyncio.create_task(self._flush_later(key, album), name=f"AlbumCollector:{key}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        album.items.append(item)
+        album.last_at = time.monotonic()
+
+    async def _flush_later(self, key: Hashable, album: _PendingAlbum):
+        while (delay := min(album.last_at + self.window, album.first_at + self.max_wait) - time.monotonic()) > 0:
+            try:
+                await asyncio.wait_for(album.closed.wait(), timeout=delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+        # Items arriving from here on start a new album under the same key
+        if self._pending.get(key) is album:
+            del self._pending[key]
+        try:
+            await self.on_album(album.items)
+        except Exception:
+            logger.exception("❌ Error processing album")
+
+    @property
+    def pending(self) -> int:
+        """Albums still collecting or being processed"""
+        return len(self._tasks)
+
+    async def flush_all(self):
+        """Process every collecting album now and wait for all of them to finish"""
+        for album in self._pending.values():
+            album.closed.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,262 @@
+import os
+import time
+import asyncio
+import logging
+import aiohttp
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, RetryPolicy
+from metrics import BACKEND_ERRORS, BACKEND_IN_FLIGHT, BACKEND_LATENCY, backend_error_reason
+
+logger = logging.getLogger(__name__)
+
+
+# Per-endpoint total timeouts (seconds). Anything not listed uses BACKEND_TIMEOUT_DEFAULT.
+DEFAULT_ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    "start": 15,
+    "help": 10,
+    "profile": 10,
+    "register": 20,
+    "upgrade": 20,
+    "get-transaction-summary": 20,
+    "get-reminders": 15,
+    "route-message": 60,
+    "process-audio": 120,
+    "process-receipt": 120,
+    "process-receipt-batch": 300,  # A whole album of receipts in one request
+    "process-bank-statement": 300,
+    # Chunked statement uploads: every call is short, however large the statement
+    "statement-upload-create": 15,
+    "statement-upload-status": 15,
+    "statement-upload-chunk": 60,
+    "statement-upload-complete": 60,
+}
+
+# Retries for idempotent read endpoints only. Endpoints that create or change data (register,
+# upgrade, process-*) must never be listed here. Hedged requests (BACKEND_HEDGING=1, off by
+# default) send a second copy of slow calls, so they are only enabled for the GET endpoints.
+_HEDGING = os.getenv('BACKEND_HEDGING', '0') == '1'
+DEFAULT_RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "help": RetryPolicy(attempts=3, hedge=_HEDGING),
+    "profile": RetryPolicy(attempts=3, hedge=_HEDGING),
+    "get-transaction-summary": RetryPolicy(attempts=3),
+    "get-reminders": RetryPolicy(attempts=3),
+    "statement-upload-status": RetryPolicy(attempts=3),
+}
+
+# Responses worth retrying: the backend or a proxy in front of it is temporarily unavailable
+RETRYABLE_STATUSES = {502, 503, 504}
+
+
+class BackendClient:
+    """Long-lived, pooled HTTP client for the OkanAssist backend API"""
+
+    def __init__(
+        self,
+        api_url: str,
+        endpoint_timeouts: Optional[Dict[str, float]] = None,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+    ):
+        self.api_url = api_url.rstrip('/')
+        self.base_path = "/okanassist/v1"
+
+        # Connection pool settings
+        self.pool_limit = int(os.getenv('BACKEND_POOL_LIMIT', 100))
+        self.pool_limit_per_host = int(os.getenv('BACKEND_POOL_LIMIT_PER_HOST', 50))
+        self.keepalive_timeout = float(os.getenv('BACKEND_KEEPALIVE_TIMEOUT', 30))
+        self.dns_cache_ttl = int(os.getenv('BACKEND_DNS_CACHE_TTL', 300))
+        self.connect_timeout = float(os.getenv('BACKEND_CONNECT_TIMEOUT', 5))
+        self.default_timeout = float(os.getenv('BACKEND_TIMEOUT_DEFAULT', 30))
+        self.health_path = os.getenv('BACKEND_HEALTH_PATH', '/health')
+        self.probe_timeout = float(os.getenv('BACKEND_PROBE_TIMEOUT', 2))
+
+        self.endpoint_timeouts = dict(DEFAULT_ENDPOINT_TIMEOUTS)
+        if endpoint_timeouts:
+            self.endpoint_timeouts.update(endpoint_timeouts)
+
+        self.retry_policies = dict(DEFAULT_RETRY_POLICIES)
+        if retry_policies:
+            self.retry_policies.update(retry_policies)
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyTracker] = {}
+
+    async def start(self):
+        """Create the shared session and connection pool"""
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.pool_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.default_timeout, connect=self.connect_timeout),
+        )
+        logger.info(
+            "🔌 Backend pool ready",
+            extra={"pool_limit": self.pool_limit, "pool_limit_per_host": self.pool_limit_per_host},
+        )
+
+    async def close(self):
+        """Close the session and release pooled connections"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if not self._session or self._session.closed:
+            raise RuntimeError("BackendClient is not started. Call start() first.")
+        return self._session
+
+    async def probe(self) -> bool:
+        """Whether the backend answers its health endpoint; bypasses circuits and metrics"""
+        try:
+            async with self.session.get(
+                f"{self.api_url}{self.health_path}",
+                timeout=aiohttp.ClientTimeout(total=self.probe_timeout),
+            ) as response:
+                return response.status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError):
+            return False
+
+    def url(self, endpoint: str) -> str:
+        return f"{self.api_url}{self.base_path}/{endpoint}"
+
+    def timeout_for(self, endpoint: str) -> aiohttp.ClientTimeout:
+        total = self.endpoint_timeouts.get(endpoint, self.default_timeout)
+        return aiohttp.ClientTimeout(total=total, connect=self.connect_timeout)
+
+    def breaker_for(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+    def circuit_states(self) -> Dict[str, Dict[str, Any]]:
+        return {endpoint: breaker.snapshot() for endpoint, breaker in self.breakers.items()}
+
+    @asynccontextmanager
+    async def request(self, method: str, endpoint: str, path: Optional[str] = None, **kwargs):
+        """Send a request to /okanassist/v1/<endpoint> and yield the response.
+
+        ``path`` overrides the URL path for endpoints with ids in it (``statement-uploads/<id>``);
+        ``endpoint`` then only names the call for timeouts, circuits and metrics.
+        Raises CircuitOpenError without touching the network while the endpoint's circuit is open.
+        Connection errors, timeouts and 5xx responses count as failures for the circuit.
+        """
+        breaker = self.breaker_for(endpoint)
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            BACKEND_ERRORS.labels(endpoint, "circuit_open").inc()
+            raise
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        in_flight = BACKEND_IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+        started = time.monotonic()
+        recorded = False
+        status: Optional[int] = None
+        try:
+            async with self.session.request(method, self.url(path or endpoint), **kwargs) as response:
+                status = response.status
+                breaker.record(response.status < 500, time.monotonic() - started)
+                recorded = True
+                reason = backend_error_reason(response.status)
+                if reason:
+                    BACKEND_ERRORS.labels(endpoint, reason).inc()
+                yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not recorded:
+                breaker.record(False, time.monotonic() - started)
+                recorded = True
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "connection"
+                BACKEND_ERRORS.labels(endpoint, reason).inc()
+            raise
+        finally:
+            if not recorded:
+                breaker.abandon()
+            duration = time.monotonic() - started
+            BACKEND_LATENCY.labels(endpoint).observe(duration)
+            in_flight.dec()
+            logger.info(
+                "Backend call",
+                extra={"endpoint": endpoint, "status": status, "duration_ms": round(duration * 1000, 1)},
+            )
+
+    async def _fetch_once(self, method: str, endpoint: str, **kwargs) -> Tuple[int, Any]:
+        started = time.monotonic()
+        async with self.request(method, endpoint, **kwargs) as response:
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                body = {}
+        if response.status < 500:
+            self.latencies.setdefault(endpoint, LatencyTracker()).observe(time.monotonic() - started)
+        return response.status, body
+
+    async def _fetch_hedged(self, policy: RetryPolicy, method: str, endpoint: str, **kwargs) -> Tuple[int, Any]:
+        """Send the request; if it is slower than the endpoint's recent p95, send it again
+        and take whichever answer arrives first"""
+        tracker = self.latencies.get(endpoint)
+        hedge_after = tracker.quantile(policy.hedge_quantile) if tracker else None
+        primary = asyncio.ensure_future(self._fetch_once(method, endpoint, **kwargs))
+        if hedge_after is None:
+            return await primary
+
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=max(hedge_after, policy.hedge_min_delay))
+            if not done:
+                pending.add(asyncio.ensure_future(self._fetch_once(method, endpoint, **kwargs)))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def fetch_json(self, method: str, endpoint: str, **kwargs) -> Tuple[int, Any]:
+        """Send a request and return ``(status, decoded JSON body)``; the body is {} if not JSON.
+
+        Endpoints with a retry policy are retried on connection errors, timeouts and
+        502/503/504 with jittered exponential backoff, and may be hedged.
+        """
+        policy = self.retry_policies.get(endpoint)
+        if policy is None:
+            return await self._fetch_once(method, endpoint, **kwargs)
+
+        for attempt in range(policy.attempts):
+            last_attempt = attempt == policy.attempts - 1
+            try:
+                if policy.hedge and method == "GET":
+                    status, body = await self._fetch_hedged(policy, method, endpoint, **kwargs)
+                else:
+                    status, body = await self._fetch_once(method, endpoint, **kwargs)
+                if status not in RETRYABLE_STATUSES or last_attempt:
+                    return status, body
+            except CircuitOpenError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+            await asyncio.sleep(policy.backoff(attempt))
+
+    def get(self, endpoint: str, **kwargs):
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs):
+        return self.request("POST", endpoint, **kwargs)
+
+    def put(self, endpoint: str, **kwargs):
+        return self.request("PUT", endpoint, **kwargs)
@@ -0,0 +1,202 @@
+import json
+import math
+import uuid
+import random
+import asyncio
+import hashlib
+from typing import Dict, Optional
+from aiohttp import web
+
+
+class EndpointProfile:
+    """Log-normal latency defined by its median and p99, plus an error (HTTP 503) rate"""
+
+    def __init__(self, median_ms: float = 50, p99_ms: float = 250, error_rate: float = 0.0):
+        self.median_ms = median_ms
+        self.p99_ms = max(p99_ms, median_ms)
+        self.error_rate = error_rate
+        # p99 of a log-normal sits 2.326 standard deviations above the median in log space
+        self.sigma = math.log(self.p99_ms / self.median_ms) / 2.326 if self.median_ms > 0 else 0
+
+    def sample_delay(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+    @classmethod
+    def parse(cls, spec: str) -> "EndpointProfile":
+        """Parse 'median_ms:p99_ms[:error_rate]', e.g. '800:3000:0.01'"""
+        parts = [float(p) for p in spec.split(':')]
+        return cls(*parts)
+
+
+DEFAULT_PROFILES: Dict[str, EndpointProfile] = {
+    "start": EndpointProfile(40, 200),
+    "help": EndpointProfile(20, 100),
+    "profile": EndpointProfile(40, 200),
+    "register": EndpointProfile(80, 400),
+    "upgrade": EndpointProfile(150, 800),
+    "get-transaction-summary": EndpointProfile(120, 600),
+    "get-reminders": EndpointProfile(60, 300),
+    "route-message": EndpointProfile(800, 4000),
+    "process-audio": EndpointProfile(1500, 6000),
+    "process-receipt": EndpointProfile(1200, 5000),
+    "process-receipt-batch": EndpointProfile(2000, 8000),
+    "process-bank-statement": EndpointProfile(3000, 12000),
+    "statement-upload-chunk": EndpointProfile(30, 150),
+}
+
+
+class FakeBackend:
+    """aiohttp application implementing the /okanassist/v1/* endpoints the bot calls"""
+
+    def __init__(
+        self, profiles: Optional[Dict[str, EndpointProfile]] = None, stream_chunks: int = 6,
+        bad_markdown_rate: float = 0.2,
+    ):
+        self.stream_chunks = stream_chunks  # route-message answers are streamed in this many parts; 0 disables
+        self.bad_markdown_rate = bad_markdown_rate  # Share of streamed answers with an unclosed Markdown entity
+        self.profiles = dict(DEFAULT_PROFILES)
+        if profiles:
+            self.profiles.update(profiles)
+        self.calls: Dict[str, int] = {}
+        self.bytes_received = 0
+        self.uploads: Dict[str, dict] = {}
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        prefix = "/okanassist/v1/statement-uploads"
+        self.app.router.add_post(prefix, self.create_upload)
+        self.app.router.add_get(prefix + "/{upload_id}", self.upload_status)
+        self.app.router.add_put(prefix + "/{upload_id}/chunks", self.upload_chunk)
+        self.app.router.add_post(prefix + "/{upload_id}/complete", self.complete_upload)
+        self.app.router.add_route("*", "/okanassist/v1/{endpoint:.+}", self.handle)
+        self.app.router.add_get("/health", lambda request: web.Response(text="ok"))
+
+    async def _drain_body(self, request: web.Request) -> int:
+        if request.content_type.startswith("multipart/"):
+            total = 0
+            reader = await request.multipart()
+            async for part in reader:
+                while chunk := await part.read_chunk():
+                    total += len(chunk)
+            return total
+        return len(await request.read())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        endpoint = request.match_info["endpoint"]
+        profile = self.profiles.get(endpoint, EndpointProfile())
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        self.bytes_received += await self._drain_body(request)
+
+        delay = profile.sample_delay()
+        if endpoint == "route-message" and self.stream_chunks:
+            accept = request.headers.get("Accept", "")
+            if "application/x-ndjson" in accept or "text/event-stream" in accept:
+                # Time to first token is a fifth of the latency, the rest is spent writing
+                await asyncio.sleep(delay / 5)
+                if random.random() < profile.error_rate:
+                    return web.json_response({"detail": "injected failure"}, status=503)
+                return await self.stream_answer(request, accept, delay * 4 / 5)
+        await asyncio.sleep(delay)
+        if random.random() < profile.error_rate:
+            return web.json_response({"detail": "injected failure"}, status=503)
+        return web.json_response(self.payload_for(endpoint))
+
+    async def stream_answer(self, request: web.Request, accept: str, duration: float) -> web.StreamResponse:
+        """Writes the answer in parts as NDJSON, or SSE if that is what the client prefers"""
+        sse = accept.find("text/event-stream") != -1 and (
+            "application/x-ndjson" not in accept or accept.find("text/event-stream") < accept.find("application/x-ndjson")
+        )
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream" if sse else "application/x-ndjson"})
+        await response.prepare(request)
+        opening = "✅ *route-message handled, " if random.random() < self.bad_markdown_rate else "✅ *route-message* handled, "
+        words = (opening + "streamed word by word " * self.stream_chunks).split(" ")
+        per_chunk = max(1, len(words) // self.stream_chunks)
+        for start in range(0, len(words), per_chunk):
+            event = {"delta": " ".join(words[start:start + per_chunk]) + " "}
+            await response.write((f"data: {json.dumps(event)}\n\n" if sse else json.dumps(event) + "\n").encode())
+            await asyncio.sleep(duration / self.stream_chunks)
+        await response.write(b"data: [DONE]\n\n" if sse else json.dumps({"done": True}).encode() + b"\n")
+        await response.write_eof()
+        return response
+
+    def _count(self, endpoint: str):
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    async def create_upload(self, request: web.Request) -> web.Response:
+        self._count("statement-upload-create")
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {"offset": 0, "sha256": hashlib.sha256(), "status": "uploading"}
+        return web.json_response({"upload_id": upload_id})
+
+    async def upload_status(self, request: web.Request) -> web.Response:
+        self._count("statement-upload-status")
+        upload = self.uploads.get(request.match_info["upload_id"])
+        if upload is None:
+            return web.json_response({"detail": "unknown upload"}, status=404)
+        return web.json_response({k: v for k, v in upload.items() if k != "sha256"})
+
+    async def upload_chunk(self, request: web.Request) -> web.Response:
+        """Appends a chunk if it starts at the current offset and matches its checksum"""
+        self._count("statement-upload-chunk")
+        upload = self.uploads.get(request.match_info["upload_id"])
+        if upload is None:
+            return web.json_response({"detail": "unknown upload"}, status=404)
+        chunk = await request.read()
+        self.bytes_received += len(chunk)
+        profile = self.profiles["statement-upload-chunk"]
+        await asyncio.sleep(profile.sample_delay())
+        if random.random() < profile.error_rate:
+            return web.json_response({"detail": "injected failure"}, status=503)
+        if int(request.query["offset"]) != upload["offset"]:
+            return web.json_response({"offset": upload["offset"]}, status=409)
+        if hashlib.sha256(chunk).hexdigest() != request.headers.get("X-Chunk-SHA256"):
+            return web.json_response({"detail": "checksum mismatch"}, status=422)
+        upload["sha256"].update(chunk)
+        upload["offset"] += len(chunk)
+        return web.json_response({"offset": upload["offset"]})
+
+    async def complete_upload(self, request: web.Request) -> web.Response:
+        """Verifies the whole file and imports it in the background, like the real backend"""
+        self._count("statement-upload-complete")
+        upload = self.uploads.get(request.match_info["upload_id"])
+        if upload is None:
+            return web.json_response({"detail": "unknown upload"}, status=404)
+        body = await request.json()
+        if body["sha256"] != upload["sha256"].hexdigest() or body["size"] != upload["offset"]:
+            return web.json_response({"detail": "checksum mismatch"}, status=422)
+        upload["status"] = "processing"
+
+        async def run_import():
+            await asyncio.sleep(self.profiles["process-bank-statement"].sample_delay())
+            upload.update(status="done", message="✅ statement imported")
+
+        asyncio.get_running_loop().create_task(run_import())
+        return web.json_response({"status": "processing"}, status=202)
+
+    @staticmethod
+    def payload_for(endpoint: str) -> dict:
+        if endpoint == "profile":
+            return {
+                "user_data": {
+                    "email": "bench@example.com",
+                    "name": "Bench User",
+                    "language": "en",
+                    "currency": "USD",
+                    "timezone": "UTC",
+                    "is_premium": False,
+                }
+            }
+        if endpoint in ("register", "upgrade"):
+            return {"success": True, "message": f"✅ {endpoint} done"}
+        return {"success": True, "message": f"✅ {endpoint} handled"}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
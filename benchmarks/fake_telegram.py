@@ -0,0 +1,115 @@
+import json
+import time
+import itertools
+from typing import Any, Dict, List
+from aiohttp import web
+
+
+class FakeTelegram:
+    """Minimal Bot API server: answers the methods the bot uses and serves media downloads.
+
+    File ids produced by the benchmark encode their size (``<kind>-<size>-<n>``) so getFile and
+    the download route can serve a body of the right length without storing anything.
+    """
+
+    BOT_INFO = {"id": 100000, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+    def __init__(self, token: str):
+        self.token = token
+        self.message_ids = itertools.count(1)
+        self.calls: Dict[str, int] = {}
+        self.sent: List[Dict[str, Any]] = []  # {"method", "chat_id", "at"}
+        self.texts: Dict[int, str] = {}  # message_id -> current text of every message sent or edited
+        self.rejected = 0  # sendMessage/editMessageText calls refused for invalid Markdown
+        self.bytes_served = 0
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            if isinstance(value, str):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+        return params
+
+    @staticmethod
+    def _invalid_markdown(params: Dict[str, Any]) -> bool:
+        """Rough stand-in for Telegram's legacy Markdown parser: entity markers must pair up"""
+        if params.get("parse_mode") != "Markdown":
+            return False
+        text = params.get("text", "")
+        return any(text.count(marker) % 2 for marker in ("*", "_", "`"))
+
+    def _message(self, chat_id: Any, text: str = "", message_id: Any = None) -> Dict[str, Any]:
+        return {
+            "message_id": int(message_id) if message_id else next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private" if int(chat_id) > 0 else "group"},
+            "text": text,
+        }
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        if request.match_info["token"] != self.token:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401)
+
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getMe":
+            result: Any = self.BOT_INFO
+        elif method in ("sendMessage", "editMessageText"):
+            if self._invalid_markdown(params):
+                self.rejected += 1
+                return web.json_response(
+                    {"ok": False, "error_code": 400, "description": "Bad Request: can't parse entities"}, status=400
+                )
+            self.sent.append({"method": method, "chat_id": params.get("chat_id"), "at": time.monotonic()})
+            result = self._message(params.get("chat_id", 0), params.get("text", ""), params.get("message_id"))
+            self.texts[result["message_id"]] = result["text"]
+        elif method == "getFile":
+            file_id = params["file_id"]
+            size = int(file_id.split("-")[1])
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": size, "file_path": f"media/{file_id}"}
+        elif method == "getUpdates":
+            result = []
+        elif method == "getMyCommands":
+            result = []
+        else:
+            # setMyCommands, sendChatAction, setWebhook, deleteWebhook, ...
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: web.Request) -> web.StreamResponse:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        size = int(file_id.split("-")[1])
+        response = web.StreamResponse(headers={"Content-Length": str(size)})
+        await response.prepare(request)
+        chunk = b"\0" * 65536
+        remaining = size
+        while remaining > 0:
+            piece = chunk[:min(remaining, len(chunk))]
+            await response.write(piece)
+            remaining -= len(piece)
+        self.bytes_served += size
+        await response.write_eof()
+        return response
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
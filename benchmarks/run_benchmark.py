@@ -0,0 +1,376 @@
+"""Load test for AgnoTelegramBot against local stand-ins for the Bot API and the backend.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmark --updates 2000 --rate 200
+    python -m benchmarks.run_benchmark --backend-latency route-message=800:3000:0.02 --json bench.json
+    python -m benchmarks.run_benchmark --max-p95-ms 5000 --min-throughput 50   # fail on regression
+
+Updates are handed to the application's update processor exactly as the update fetcher does,
+so concurrency limits and per-user ordering are exercised. Handler latency is measured from
+dispatch until the update's handler returns.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.fake_backend import FakeBackend, EndpointProfile, DEFAULT_PROFILES
+from benchmarks.fake_telegram import FakeTelegram
+
+BENCH_TOKEN = "123456:BENCHMARK-TOKEN"
+
+# Share of each kind of traffic in the synthetic stream
+DEFAULT_MIX = {
+    "text": 0.40,
+    "command": 0.25,
+    "photo": 0.10,
+    "album": 0.05,
+    "pdf": 0.05,
+    "voice": 0.05,
+    "registration": 0.10,
+    "redelivery": 0.03,
+    "double_tap": 0.03,
+}
+COMMANDS = ["/help", "/balance", "/reminders", "/profile", "/start", "/upgrade"]
+
+
+class UpdateFactory:
+    """Builds raw Bot API update dicts for synthetic users"""
+
+    def __init__(self, users: int, seed: int):
+        self.users = users
+        self.random = random.Random(seed)
+        self.update_ids = iter(range(1, 10 ** 9))
+        self.media_ids = iter(range(1, 10 ** 9))
+
+    def _base(self, user_id: int) -> Dict[str, Any]:
+        update_id = next(self.update_ids)
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "en"},
+            },
+        }
+
+    def text(self, user_id: int, text: str) -> Dict[str, Any]:
+        update = self._base(user_id)
+        update["message"]["text"] = text
+        if text.startswith("/"):
+            command = text.split()[0]
+            update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return update
+
+    def photo(self, user_id: int, size: int) -> Dict[str, Any]:
+        update = self._base(user_id)
+        file_id = f"photo-{size}-{next(self.media_ids)}"
+        update["message"]["photo"] = [
+            {"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960, "file_size": size}
+        ]
+        return update
+
+    def album(self, user_id: int, photos: int) -> List[Dict[str, Any]]:
+        """Photos sent together: separate updates sharing a media_group_id"""
+        group_id = f"album-{next(self.media_ids)}"
+        updates = [self.photo(user_id, self.random.randint(100_000, 900_000)) for _ in range(photos)]
+        for update in updates:
+            update["message"]["media_group_id"] = group_id
+        return updates
+
+    def pdf(self, user_id: int, size: int) -> Dict[str, Any]:
+        update = self._base(user_id)
+        file_id = f"pdf-{size}-{next(self.media_ids)}"
+        update["message"]["document"] = {
+            "file_id": file_id, "file_unique_id": file_id, "file_name": "statement.pdf",
+            "mime_type": "application/pdf", "file_size": size,
+        }
+        return update
+
+    def voice(self, user_id: int, size: int) -> Dict[str, Any]:
+        update = self._base(user_id)
+        file_id = f"voice-{size}-{next(self.media_ids)}"
+        update["message"]["voice"] = {
+            "file_id": file_id, "file_unique_id": file_id, "duration": 5, "mime_type": "audio/ogg", "file_size": size,
+        }
+        return update
+
+    def registration(self, user_id: int) -> List[Dict[str, Any]]:
+        return [
+            self.text(user_id, "/register"),
+            self.text(user_id, f"user{user_id}@example.com"),
+            self.text(user_id, "/skip"),
+            self.text(user_id, "Tester"),
+            self.text(user_id, "London"),
+            self.text(user_id, "/confirm"),
+        ]
+
+    def stream(self, count: int, mix: Dict[str, float]) -> List[Tuple[str, Dict[str, Any]]]:
+        """A list of (kind, update) in arrival order"""
+        kinds, weights = zip(*mix.items())
+        updates: List[Tuple[str, Dict[str, Any]]] = []
+        while len(updates) < count:
+            kind = self.random.choices(kinds, weights)[0]
+            user_id = self.random.randint(1, self.users)
+            if kind == "text":
+                updates.append((kind, self.text(user_id, "spent 15 dollars on lunch")))
+            elif kind == "command":
+                updates.append((kind, self.text(user_id, self.random.choice(COMMANDS))))
+            elif kind == "photo":
+                updates.append((kind, self.photo(user_id, self.random.randint(100_000, 900_000))))
+            elif kind == "album":
+                updates.extend((kind, update) for update in self.album(user_id, self.random.randint(2, 5)))
+            elif kind == "pdf":
+                updates.append((kind, self.pdf(user_id, self.random.randint(500_000, 5_000_000))))
+            elif kind == "voice":
+                updates.append((kind, self.voice(user_id, self.random.randint(20_000, 200_000))))
+            elif kind == "registration":
+                # Fresh user ids so the flow never collides with another conversation
+                reg_user = self.users + len(updates) + 1
+                updates.extend((kind, update) for update in self.registration(reg_user))
+            elif kind == "redelivery" and updates:
+                # Telegram sending an update again, verbatim
+                updates.append((kind, self.random.choice(updates)[1]))
+            elif kind == "double_tap":
+                command = self.random.choice(COMMANDS)
+                updates.extend((kind, self.text(user_id, command)) for _ in range(2))
+        return updates[:count]
+
+
+def open_sockets() -> Optional[int]:
+    """Number of open socket file descriptors of this process (Linux only)"""
+    fd_dir = "/proc/self/fd"
+    if not os.path.isdir(fd_dir):
+        return None
+    count = 0
+    for fd in os.listdir(fd_dir):
+        try:
+            if os.readlink(os.path.join(fd_dir, fd)).startswith("socket:"):
+                count += 1
+        except OSError:
+            continue
+    return count
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    profiles = dict(DEFAULT_PROFILES)
+    for spec in args.backend_latency or []:
+        endpoint, profile = spec.split("=", 1)
+        profiles[endpoint] = EndpointProfile.parse(profile)
+    for endpoint, profile in profiles.items():
+        error_rate = profile.error_rate if args.backend_error_rate is None else args.backend_error_rate
+        profiles[endpoint] = EndpointProfile(
+            profile.median_ms * args.latency_scale, profile.p99_ms * args.latency_scale, error_rate
+        )
+
+    backend = FakeBackend(profiles)
+    telegram = FakeTelegram(BENCH_TOKEN)
+    backend_url = await backend.start()
+    telegram_url = await telegram.start()
+
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": BENCH_TOKEN,
+        "API_SERVICE_URL": backend_url,
+        "TELEGRAM_BASE_URL": f"{telegram_url}/bot",
+        "TELEGRAM_BASE_FILE_URL": f"{telegram_url}/file/bot",
+        "BOT_MODE": "polling",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("STATEMENT_UPLOAD_MODE", "chunked")  # The fake backend has statement-uploads
+    os.environ.setdefault("STATEMENT_POLL_INTERVAL", "0.2")
+    os.environ.setdefault("JOB_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix="bot-bench-"), "jobs.sqlite3"))
+    if args.concurrency:
+        os.environ["BOT_MAX_CONCURRENT_UPDATES"] = str(args.concurrency)
+    if args.telegram_rate:
+        os.environ["TELEGRAM_OVERALL_RATE"] = str(args.telegram_rate)
+
+    from bot_handler import AgnoTelegramBot  # Imported after the environment is prepared
+    from bot_logging import configure_logging
+    from telegram import Update
+
+    configure_logging()
+
+    bot = AgnoTelegramBot()
+    bot.setup()
+    await bot.start_components()
+    app = bot.app
+
+    factory = UpdateFactory(users=args.users, seed=args.seed)
+    stream = factory.stream(args.updates, DEFAULT_MIX)
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    rss_before = rss_bytes()
+    sockets_before = open_sockets()
+    sockets_peak = sockets_before or 0
+
+    latencies: Dict[str, List[float]] = {}
+    errors = 0
+
+    async def dispatch(kind: str, raw: Dict[str, Any]):
+        nonlocal errors
+        update = Update.de_json(raw, app.bot)
+        started = time.monotonic()
+        try:
+            await app.update_processor.process_update(update, app.process_update(update))
+        except Exception:
+            errors += 1
+        latencies.setdefault(kind, []).append(time.monotonic() - started)
+
+    async def sample_sockets():
+        nonlocal sockets_peak
+        while True:
+            sockets_peak = max(sockets_peak, open_sockets() or 0)
+            await asyncio.sleep(0.2)
+
+    sampler = asyncio.create_task(sample_sockets())
+    interval = 1 / args.rate if args.rate else 0
+    started = time.monotonic()
+    tasks = []
+    for index, (kind, raw) in enumerate(stream):
+        tasks.append(asyncio.create_task(dispatch(kind, raw)))
+        if interval:
+            # Open-loop arrivals: keep to the schedule even if the bot falls behind
+            delay = started + (index + 1) * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    await asyncio.gather(*tasks)
+    # Album and statement handlers return before the backend work is done
+    await bot.albums.flush_all()
+    await bot.jobs.join()
+    elapsed = time.monotonic() - started
+    sampler.cancel()
+
+    memory_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rss_after = rss_bytes()
+    sockets_idle = open_sockets()
+
+    await bot.stop_components()
+    sockets_after = open_sockets()
+    await telegram.stop()
+    await backend.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    report = {
+        "updates": len(stream),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(stream) / elapsed, 1) if elapsed else 0.0,
+        "errors": errors,
+        "latency_ms": {
+            "p50": round(percentile(all_latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(all_latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(all_latencies, 0.99) * 1000, 1),
+        },
+        "latency_ms_by_kind": {
+            kind: {
+                "count": len(values),
+                "p50": round(percentile(values, 0.50) * 1000, 1),
+                "p95": round(percentile(values, 0.95) * 1000, 1),
+                "p99": round(percentile(values, 0.99) * 1000, 1),
+            }
+            for kind, values in sorted(latencies.items())
+        },
+        "python_heap_growth_bytes": memory_after - memory_before,
+        "rss_growth_bytes": (rss_after - rss_before) if rss_before and rss_after else None,
+        "open_sockets": {"before": sockets_before, "peak": sockets_peak, "idle": sockets_idle, "after_shutdown": sockets_after},
+        "updates_skipped": dict(bot.update_processor.skipped),
+        "backend_calls": backend.calls,
+        "telegram_calls": telegram.calls,
+        "telegram_rejected_markdown": telegram.rejected,
+        # Streamed replies whose final edit never landed still end in the typing cursor
+        "unfinished_replies": sum(1 for text in telegram.texts.values() if text.endswith("▌")),
+        "media_bytes": {"downloaded": telegram.bytes_served, "uploaded": backend.bytes_received},
+    }
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency_ms"]
+    print(f"\n📊 {report['updates']} updates in {report['elapsed_s']}s "
+          f"→ {report['updates_per_s']} updates/s ({report['errors']} errors)")
+    print(f"⏱️  handler latency p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms")
+    for kind, stats in report["latency_ms_by_kind"].items():
+        print(f"   {kind:<13} n={stats['count']:<6} p50={stats['p50']:<8} p95={stats['p95']:<8} p99={stats['p99']}")
+    print(f"🧠 python heap growth: {report['python_heap_growth_bytes'] / 1024:.0f} KiB, "
+          f"RSS growth: {(report['rss_growth_bytes'] or 0) / 1024:.0f} KiB")
+    sockets = report["open_sockets"]
+    print(f"🔌 open sockets: before={sockets['before']} peak={sockets['peak']} "
+          f"idle={sockets['idle']} after shutdown={sockets['after_shutdown']}")
+    print(f"📦 media bytes: downloaded={report['media_bytes']['downloaded']} uploaded={report['media_bytes']['uploaded']}")
+    print(f"⏭️  updates skipped: {report['updates_skipped']}")
+    print(f"🌐 backend calls: {report['backend_calls']}")
+    print(f"✉️  telegram calls: {report['telegram_calls']} "
+          f"(invalid Markdown rejected: {report['telegram_rejected_markdown']}, "
+          f"replies left unfinished: {report['unfinished_replies']})")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=1000, help="number of synthetic updates")
+    parser.add_argument("--users", type=int, default=200, help="distinct users in the stream")
+    parser.add_argument("--rate", type=float, default=0, help="arrival rate in updates/s (0 = all at once)")
+    parser.add_argument("--concurrency", type=int, help="override BOT_MAX_CONCURRENT_UPDATES")
+    parser.add_argument("--telegram-rate", type=float,
+                        help="override TELEGRAM_OVERALL_RATE to measure the bot without Bot API send limits")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiply every backend latency (e.g. 0.1 for a quick smoke run)")
+    parser.add_argument("--backend-latency", action="append", metavar="ENDPOINT=MEDIAN:P99[:ERR]",
+                        help="latency/error profile for one backend endpoint; repeatable")
+    parser.add_argument("--backend-error-rate", type=float, help="error rate applied to every endpoint")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="exit non-zero if overall p95 exceeds this")
+    parser.add_argument("--min-throughput", type=float, help="exit non-zero if updates/s falls below this")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+
+    failed = False
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        print(f"❌ p95 {report['latency_ms']['p95']}ms exceeds {args.max_p95_ms}ms")
+        failed = True
+    if args.min_throughput is not None and report["updates_per_s"] < args.min_throughput:
+        print(f"❌ throughput {report['updates_per_s']} updates/s is below {args.min_throughput}")
+        failed = True
+    if report["unfinished_replies"]:
+        print(f"❌ {report['unfinished_replies']} streamed replies never got their final text")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
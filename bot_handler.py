@@ -1,18 +1,44 @@
 import os
+import json
+import time
+import hashlib
+import hmac
+import signal
 import asyncio
+import logging
 import aiohttp
-import tempfile
+import contextlib
 from aiohttp import web 
 #import pytz  # <-- 1. Import pytz
-from typing import Optional, Dict, Any
-from telegram import Update, BotCommand
+from typing import Optional, Dict, Any, List
+from telegram import Update, BotCommand, Message, ReplyParameters
+from telegram.constants import ChatAction
+from telegram.error import TelegramError
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, filters, 
+    Application, CommandHandler, MessageHandler, TypeHandler, filters, 
     ContextTypes, ConversationHandler
 )
-from telegram.helpers import escape_markdown  # <-- 1. Import the escape helper
 from dotenv import load_dotenv
-from messages import get_message, MESSAGES
+from messages import get_message, MESSAGES, DEFAULT_LANGUAGE
+from backend_client import BackendClient
+from update_processor import PerUserUpdateProcessor
+from media import MediaStreamer
+from cache import TTLCache, ResponseCache
+from albums import AlbumCollector
+from uploads import ChunkedUploader, UploadError, UploadsUnsupported
+from jobs import Job, JobQueue, QueueFull
+from feedback import ProgressiveReply, sends_chat_action
+from streaming import ACCEPT_STREAMING, is_streaming, iter_text
+from rate_limiter import SendScheduler, PRIORITY_BACKGROUND
+from state_store import create_state_store, SQLiteStateStore, StateStorePersistence
+from resilience import CircuitOpenError
+from bot_logging import configure_logging
+from health import HealthChecker
+from startup import PROFILE, EarlyServer
+from workers import WorkerPool
+from metrics import (
+    CACHES, JOBS_QUEUED, JOBS_RUNNING, SEND_QUEUE_DEPTH, UPDATE_QUEUE_DEPTH, UPDATES_IN_PROCESSOR, metrics_endpoint, track_handler
+)
 # Load environment variables first
 load_dotenv()
 
@@ -20,28 +46,177 @@ load_dotenv()
 REGISTER_EMAIL, REGISTER_NAME, REGISTER_LASTNAME, REGISTER_TIMEZONE, REGISTER_CONFIRM = range(5)  # <-- 2. Add new state
 SUPPORT_MESSAGE = range(5, 6)
 
+logger = logging.getLogger(__name__)
+
+# Seconds of the shutdown grace period kept for stop_components() and process exit
+SHUTDOWN_EXIT_RESERVE = 1.0
+
 class AgnoTelegramBot:
     """Telegram bot with session-based authentication"""
     
-    def __init__(self, api_url: str = None):
+    def __init__(self, api_url: str = None, role: str = None):
         # Load environment variables
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.api_url = api_url or os.getenv('API_SERVICE_URL', 'http://localhost:8000')
         self.support_chat_id = os.getenv('SUPPORT_CHAT_ID')  # <-- 2. Load the support chat ID
+
+        # Update ingestion: "polling" (default) or "webhook"
+        self.bot_mode = os.getenv('BOT_MODE', 'polling').lower()
+        self.webhook_url = os.getenv('WEBHOOK_URL')  # Public base URL, e.g. https://bot-xyz.a.run.app
+        self.webhook_path = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET_TOKEN')
+
+        # Alternative Bot API server (a local telegram-bot-api instance, or the benchmark stand-in)
+        self.telegram_base_url = os.getenv('TELEGRAM_BASE_URL')
+        self.telegram_base_file_url = os.getenv('TELEGRAM_BASE_FILE_URL')
+
+        # Process layout: one "standalone" process, or an "ingress" feeding BOT_WORKERS "worker" processes
+        self.workers = int(os.getenv('BOT_WORKERS', 1))
+        self.role = role or ("ingress" if self.workers > 1 else "standalone")
+
+        # Concurrency: handlers running at once, and updates allowed to wait behind them
+        self.max_concurrent_updates = int(os.getenv('BOT_MAX_CONCURRENT_UPDATES', 32))
+        pending = os.getenv('BOT_MAX_PENDING_UPDATES')
+        self.max_pending_updates = int(pending) if pending else None
+
+        # Redelivered update ids are dropped for UPDATE_DEDUP_WINDOW seconds, and a repeat of
+        # one of these commands waits for nothing: it shares the reply of the one in flight
+        self.update_dedup_window = float(os.getenv('UPDATE_DEDUP_WINDOW', 600))
+        self.coalesce_commands = [
+            command.strip().lstrip('/') for command in
+            os.getenv('COALESCE_COMMANDS', 'start,help,balance,reminders,profile,upgrade').split(',')
+            if command.strip()
+        ]
+
+        # Seconds between SIGTERM and SIGKILL (Cloud Run: 10). drain() works to a single deadline
+        # SHUTDOWN_EXIT_RESERVE before it; in-flight updates and jobs get at most
+        # SHUTDOWN_DRAIN_TIMEOUT of that, and queued replies at least SHUTDOWN_SEND_DRAIN_TIMEOUT
+        self.shutdown_grace_period = float(os.getenv('SHUTDOWN_GRACE_PERIOD', 10))
+        self.drain_timeout = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 8))
+        self.send_drain_timeout = float(os.getenv('SHUTDOWN_SEND_DRAIN_TIMEOUT', 1))
+        self.accepting_updates = True
+
+        # STARTUP_PROFILE=1: start up, log the time spent in each phase, then shut down
+        self.startup_profile_only = os.getenv('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
         
         # Validate required environment variables
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required")
+        if self.bot_mode not in ("polling", "webhook"):
+            raise ValueError(f"Unknown BOT_MODE '{self.bot_mode}', expected 'polling' or 'webhook'")
+        if self.bot_mode == "webhook" and not (self.webhook_url and self.webhook_secret):
+            raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET_TOKEN are required when BOT_MODE=webhook")
+        if self.role not in ("standalone", "ingress", "worker"):
+            raise ValueError(f"Unknown role '{self.role}', expected 'standalone', 'ingress' or 'worker'")
         
-        print(f"🔗 Initializing bot with token: {self.token[:20]}...")
-        print(f"🔗 API service URL: {self.api_url}")
+        logger.info("🔗 Initializing bot", extra={"bot_id": self.token.split(':')[0], "api_url": self.api_url})
         
         self.app = None
-        self.registration_data: Dict[str, Dict[str, Any]] = {}
+        self.backend = BackendClient(self.api_url)
+        self.media = MediaStreamer(self.backend)
+        # Backend results for already-processed media, keyed by (telegram_id, file_unique_id)
+        self.media_results = TTLCache(
+            max_entries=int(os.getenv('MEDIA_CACHE_MAX_ENTRIES', 5000)),
+            ttl=float(os.getenv('MEDIA_CACHE_TTL', 24 * 3600)),
+        )
+        # Receipt photos sent as an album are collected and processed as one batch
+        self.albums = AlbumCollector(self.process_receipt_album)
+        # Cached GET responses: /help depends only on the language, /profile on the user
+        self.responses = ResponseCache(
+            ttls={
+                "help": float(os.getenv('RESPONSE_CACHE_TTL_HELP', 3600)),
+                "profile": float(os.getenv('RESPONSE_CACHE_TTL_PROFILE', 60)),
+            },
+            max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000)),
+        )
+        # In-flight registrations and conversation states; abandoned ones expire after the TTL
+        self.registration_ttl = float(os.getenv('REGISTRATION_TTL', 3600))
+        self.state_store = create_state_store(default_ttl=self.registration_ttl)
+
+        # Free-text answers the backend streams are shown as they are written, edited in at
+        # most every STREAM_EDIT_INTERVAL seconds (edits share the chat's send budget). Answers
+        # complete within STREAM_FIRST_UPDATE_DELAY seconds are sent once, without partials.
+        self.stream_replies = os.getenv('STREAM_REPLIES', '1') == '1'
+        self.stream_edit_interval = float(os.getenv('STREAM_EDIT_INTERVAL', 1.5))
+        self.stream_first_update_delay = float(os.getenv('STREAM_FIRST_UPDATE_DELAY', 1.0))
+
+        # Albums go to the backend in one process-receipt-batch request only when it has that
+        # endpoint; otherwise (or once it answers 404/405) each photo is posted to process-receipt
+        self.receipt_batch_requests = os.getenv('RECEIPT_BATCH_REQUESTS', '0') == '1'
+
+        # Bank statements: "single" posts the whole PDF inline; "chunked" uploads run as background
+        # jobs and need the backend's statement-uploads endpoints (a 404/405 switches back to single)
+        self.statement_upload_mode = os.getenv('STATEMENT_UPLOAD_MODE', 'single').lower()
+        self.jobs: Optional[JobQueue] = None
+        self.statements: Optional[ChunkedUploader] = None
+        if self.role != "ingress":
+            # Receipt OCR, transcription and statement imports run as background jobs, kept on
+            # local disk so a restarted process picks them up again (worker processes get one file each)
+            job_store_path = os.getenv('JOB_STORE_PATH', 'bot_jobs.sqlite3')
+            worker_index = os.getenv('BOT_WORKER_INDEX')
+            if worker_index is not None:
+                job_store_path = f"{os.path.splitext(job_store_path)[0]}-{worker_index}.sqlite3"
+            self.job_store = SQLiteStateStore(job_store_path)
+            self.jobs = JobQueue(self.job_store, {
+                "receipt": self.process_receipt_job,
+                "audio": self.process_audio_job,
+                "statement": self.process_statement_job,
+            })
+            # Upload ids live next to the jobs, so a restarted import resumes its upload too
+            self.statements = ChunkedUploader(self.backend, self.media, self.job_store)
+        self.worker_pool = WorkerPool(
+            # Workers finish early enough for this process to shut down after them
+            self.workers, shutdown_grace_period=self.shutdown_grace_period - SHUTDOWN_EXIT_RESERVE,
+        ) if self.role == "ingress" else None
 
     def setup(self):
         """Setup the Telegram bot"""
-        self.app = Application.builder().token(self.token).build()
+        # Updates from different users run concurrently; a single user's updates stay ordered
+        # so the registration and support conversations see their messages in sequence.
+        update_processor = self.update_processor = PerUserUpdateProcessor(
+            max_concurrent_updates=self.max_concurrent_updates,
+            max_pending_updates=self.max_pending_updates,
+            dedup_window=self.update_dedup_window,
+            coalesce_commands=self.coalesce_commands,
+            # Handled ids are only worth storing where they outlive the process, i.e. in SQLite;
+            # the ingress only forwards updates, the worker that handles one records it
+            store=self.state_store if self.role != "ingress" and isinstance(self.state_store, SQLiteStateStore) else None,
+        )
+        self.send_scheduler = SendScheduler()
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(update_processor)
+            .rate_limiter(self.send_scheduler)
+        )
+        if self.role != "ingress":
+            builder = builder.persistence(
+                StateStorePersistence(self.state_store, conversation_ttl=self.registration_ttl)
+            )
+        if self.role == "worker":
+            builder = builder.updater(None)  # Updates arrive from the ingress process
+        if self.telegram_base_url:
+            builder = builder.base_url(self.telegram_base_url)
+        if self.telegram_base_file_url:
+            builder = builder.base_file_url(self.telegram_base_file_url)
+        self.app = builder.build()
+
+        # Queue depths are read when /metrics is scraped
+        UPDATE_QUEUE_DEPTH.set_function(lambda: self.app.update_queue.qsize())
+        UPDATES_IN_PROCESSOR.set_function(lambda: update_processor.current_concurrent_updates)
+        SEND_QUEUE_DEPTH.set_function(lambda: self.send_scheduler.pending)
+        if self.jobs:
+            JOBS_QUEUED.set_function(lambda: self.jobs.queued)
+            JOBS_RUNNING.set_function(lambda: self.jobs.running)
+        CACHES.track("media_results", self.media_results)
+        CACHES.track("responses", self.responses)
+
+        self.health = HealthChecker(self.app, update_processor, self.backend, self.bot_mode, self.worker_pool)
+
+        if self.role == "ingress":
+            # The ingress only routes; handlers run in the worker that owns the user
+            self.app.add_handler(TypeHandler(Update, self.forward_update))
+            return self.app
         
         # Registration conversation handler
         registration_handler = ConversationHandler(
@@ -64,6 +239,8 @@ class AgnoTelegramBot:
                 ],
             },
             fallbacks=[CommandHandler("cancel", self.register_cancel)],
+            name="registration",
+            persistent=True,
         )
         self.app.add_handler(registration_handler)
         
@@ -74,6 +251,8 @@ class AgnoTelegramBot:
                 SUPPORT_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.support_message)],
             },
             fallbacks=[CommandHandler("cancel", self.support_cancel)],
+            name="support",
+            persistent=True,
         )
         self.app.add_handler(support_handler)
 
@@ -101,17 +280,27 @@ class AgnoTelegramBot:
     
    
     # Registration conversation handlers
+    async def get_registration(self, update: Update) -> Optional[Dict[str, Any]]:
+        """Load the user's in-progress registration, telling them if it has expired"""
+        data = await self.state_store.get("registration", str(update.effective_user.id))
+        if data is None:
+            await update.message.reply_text(
+                get_message("register_expired", update.effective_user.language_code)
+            )
+        return data
+
+    @track_handler
     async def register_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start registration process"""
         user = update.effective_user
         telegram_id = str(user.id)
         
         # Initialize registration data
-        self.registration_data[telegram_id] = {
+        await self.state_store.set("registration", telegram_id, {
             "telegram_id": telegram_id,
             "first_name": user.first_name,
             "language_code": user.language_code or "en"
-        }
+        })
         
         await update.message.reply_text(
             get_message("register_start", user.language_code),
@@ -120,10 +309,15 @@ class AgnoTelegramBot:
         
         return REGISTER_EMAIL
     
+    @track_handler
     async def register_email(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle email input"""
         email = update.message.text.strip()
         telegram_id = str(update.effective_user.id)
+        # Checked first: a conversation whose data expired must end, not keep asking for an email
+        data = await self.get_registration(update)
+        if data is None:
+            return ConversationHandler.END
         
         # Basic email validation
         if "@" not in email or "." not in email:
@@ -132,22 +326,28 @@ class AgnoTelegramBot:
             )
             return REGISTER_EMAIL
         
-        self.registration_data[telegram_id]["email"] = email
+        data["email"] = email
+        await self.state_store.set("registration", telegram_id, data)
         
         await update.message.reply_text(
-            get_message("register_first_name", update.effective_user.language_code, email=escape_markdown(email, version=2), first_name=escape_markdown(update.effective_user.first_name, version=2)),
+            get_message("register_first_name", update.effective_user.language_code, escape="MarkdownV2", email=email, first_name=update.effective_user.first_name),
         )
         
         return REGISTER_NAME
     
+    @track_handler
     async def register_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle first name input"""
         telegram_id = str(update.effective_user.id)
+        data = await self.get_registration(update)
+        if data is None:
+            return ConversationHandler.END
         
         # --- 2. Check if the input is NOT a command before updating ---
         if not update.message.text.startswith('/'):
             first_name = update.message.text.strip()
-            self.registration_data[telegram_id]["first_name"] = first_name
+            data["first_name"] = first_name
+            await self.state_store.set("registration", telegram_id, data)
         
         await update.message.reply_text(
            get_message("register_last_name", update.effective_user.language_code)
@@ -155,14 +355,19 @@ class AgnoTelegramBot:
         
         return REGISTER_LASTNAME
     
+    @track_handler
     async def register_lastname(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle last name input"""
         telegram_id = str(update.effective_user.id)
+        data = await self.get_registration(update)
+        if data is None:
+            return ConversationHandler.END
         
         # --- 2. Check if the input is NOT a command before updating ---
         if not update.message.text.startswith('/'):
             last_name = update.message.text.strip()
-            self.registration_data[telegram_id]["last_name"] = last_name
+            data["last_name"] = last_name
+            await self.state_store.set("registration", telegram_id, data)
         
         # --- 1. Update the prompt to encourage natural language ---
         await update.message.reply_text(
@@ -173,24 +378,28 @@ class AgnoTelegramBot:
         return REGISTER_TIMEZONE
 
     # --- 2. Simplify the timezone handler ---
+    @track_handler
     async def register_timezone(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle timezone input by capturing the raw text."""
         timezone_input = update.message.text.strip()
         telegram_id = str(update.effective_user.id)
 
+        data = await self.get_registration(update)
+        if data is None:
+            return ConversationHandler.END
+
         # Store the raw text. The API will process it.
-        self.registration_data[telegram_id]["timezone"] = timezone_input
+        data["timezone"] = timezone_input
+        await self.state_store.set("registration", telegram_id, data)
         
         # Immediately proceed to the confirmation step
-        return await self.show_registration_confirmation(update, context)
+        return await self.show_registration_confirmation(update, context, data)
 
-    async def show_registration_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def show_registration_confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: Dict[str, Any]):
         """Helper function to display the final confirmation message."""
-        telegram_id = str(update.effective_user.id)
-        data = self.registration_data[telegram_id]
         
         confirmation_text = (
-            get_message("register_confirmation", update.effective_user.language_code, email=escape_markdown(data["email"], version=2), first_name=escape_markdown(data["first_name"], version=2))
+            get_message("register_confirmation", update.effective_user.language_code, escape="MarkdownV2", email=data["email"], first_name=data["first_name"])
         )
         
         if data.get("last_name"):
@@ -198,56 +407,64 @@ class AgnoTelegramBot:
         
         # --- 2. Update the prompt to use commands ---
         confirmation_text += (
-           get_message("register_confirmation_with_timezone", update.effective_user.language_code, language=escape_markdown(data["language_code"], version=2), timezone=escape_markdown(data["timezone"], version=2))
+           get_message("register_confirmation_with_timezone", update.effective_user.language_code, escape="MarkdownV2", language=data["language_code"], timezone=data["timezone"])
         )
         
         await update.message.reply_text(confirmation_text, parse_mode='Markdown')
         return REGISTER_CONFIRM
 
     # --- 3. Refactor the confirmation logic ---
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
     async def register_confirm(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle the /confirm command to finalize registration."""
         telegram_id = str(update.effective_user.id)
         
+        data = await self.get_registration(update)
+        if data is None:
+            return ConversationHandler.END
+
         # Submit registration to API
         try:
-            data = self.registration_data[telegram_id]
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/okanassist/v1/register",
-                    json={
-                        "telegram_id": data["telegram_id"],
-                        "email": data["email"],
-                        "name": data["first_name"]+" "+data.get("last_name",""),
-                        "language_code": data["language_code"],
-                        "timezone": data["timezone"],
-                        "currency": "USD"
-                    }
-                ) as response:
-                    result = await response.json()
+            async with self.backend.post(
+                "register",
+                json={
+                    "telegram_id": data["telegram_id"],
+                    "email": data["email"],
+                    "name": data["first_name"]+" "+data.get("last_name",""),
+                    "language_code": data["language_code"],
+                    "timezone": data["timezone"],
+                    "currency": "USD"
+                }
+            ) as response:
+                result = await response.json()
                     
-                    if response.status == 200 and result.get("success"):
-                        await update.message.reply_text(
-                            result["message"],
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        await update.message.reply_text(
-                            f"❌ Registration failed: {result.get('message', 'Unknown error')}"
-                        )
+                if response.status == 200 and result.get("success"):
+                    # A cached 'not registered' profile must not outlive the new account
+                    self.responses.invalidate(scope=telegram_id)
+                    await update.message.reply_text(
+                        result["message"],
+                        parse_mode='Markdown'
+                    )
+                else:
+                    await update.message.reply_text(
+                        f"❌ Registration failed: {result.get('message', 'Unknown error')}"
+                    )
             
             # Clean up registration data
-            del self.registration_data[telegram_id]
+            await self.state_store.delete("registration", telegram_id)
             
-        except Exception as e:
-            print(f"❌ Error during registration: {e}")
+        except CircuitOpenError:
+            await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
+        except Exception:
+            logger.exception("❌ Error during registration")
             await update.message.reply_text(
                 "❌ Registration failed due to a technical error. Please try again later."
             )
         
         return ConversationHandler.END
 
+    @track_handler
     async def register_invalid_confirm_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handles any input that is not /confirm or /cancel at the final step."""
         await update.message.reply_text(
@@ -255,12 +472,12 @@ class AgnoTelegramBot:
         )
         return REGISTER_CONFIRM
     
+    @track_handler
     async def register_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Cancel registration"""
         telegram_id = str(update.effective_user.id)
         
-        if telegram_id in self.registration_data:
-            del self.registration_data[telegram_id]
+        await self.state_store.delete("registration", telegram_id)
         
         await update.message.reply_text(
             "❌ Registration cancelled.\n"
@@ -270,17 +487,20 @@ class AgnoTelegramBot:
         
         return ConversationHandler.END
     
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command by calling the API's handle_start directly"""
         user = update.effective_user
         args = context.args
-        print(f"context received:{args}")
-        print(f"👤 /start command from {user.first_name} ({user.id})")
+        logger.debug("👤 /start command", extra={"start_args": len(args or [])})
         
         # Handle payment status or Supabase ID
         if args and len(args) > 0:
 
             if args[0]=="payment_success":
+                # Premium status changed; drop the cached profile
+                self.responses.invalidate(scope=str(user.id))
                 await update.message.reply_text(
                     get_message("payment_success", update.effective_user.language_code),
                     parse_mode='Markdown'
@@ -293,6 +513,8 @@ class AgnoTelegramBot:
                 )
                 return
             elif args[0]=="portal_return":
+                # The subscription may have been changed in the portal
+                self.responses.invalidate(scope=str(user.id))
                 await update.message.reply_text(
                     get_message("portal_return", update.effective_user.language_code),
                     parse_mode='Markdown'
@@ -300,71 +522,74 @@ class AgnoTelegramBot:
                 return
             else:
                 supabase_user_id = args[0]               
-                print(f"📱 Redirect from mobile app with data: {supabase_user_id}")
+                logger.info("📱 Redirect from mobile app")
                 # Optionally, you can call your API with the Supabase ID here if needed
         
         # Always call the API's /okanassist/v1/start endpoint - let the API handle authentication and responses
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/okanassist/v1/start",
-                    json={
-                        "user_id": str(user.id),
-                        "user_data": user.to_dict(),
-                        "args": args,
-                        "language_code": user.language_code # <-- Pass language
-                    }
-                ) as response:
-                    result = await response.json()
-                    await update.message.reply_text(result["message"], parse_mode='Markdown', disable_web_page_preview=True)
-        except Exception as e:
-            print(f"❌ Error in start command: {e}")
+            async with self.backend.post(
+                "start",
+                json={
+                    "user_id": str(user.id),
+                    "user_data": user.to_dict(),
+                    "args": args,
+                    "language_code": user.language_code # <-- Pass language
+                }
+            ) as response:
+                result = await response.json()
+                await update.message.reply_text(result["message"], parse_mode='Markdown', disable_web_page_preview=True)
+        except CircuitOpenError:
+            await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
+        except Exception:
+            logger.exception("❌ Error in start command")
             await update.message.reply_text(get_message("generic_error", update.effective_user.language_code))
         
         # --- 3. REMOVE the return value ---
         # return ConversationHandler.END
 
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
     async def upgrade_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle the /upgrade command to get a premium payment link."""
         user = update.effective_user
         telegram_id = str(user.id)
-        print(f"🚀 /upgrade command from {user.first_name}")
+        logger.debug("🚀 /upgrade command")
         #await update.message.reply_text(get_message("generic_maintenance", update.effective_user.language_code))
         #await update.message.reply_text(get_message("upgrade_link_generation", update.effective_user.language_code))
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/okanassist/v1/upgrade",
-                    json={"user_id": telegram_id}
-                ) as response:
-                    result = await response.json()
-                    message = result.get("message", "An error occurred.")
-
-                    if response.status == 200 and result.get("success"):
-                        # Success! The message from the API will contain the payment link.
-                        await update.message.reply_text(
-                            message,
-                            parse_mode='Markdown',
-                            disable_web_page_preview=False # Ensure the link preview shows
-                        )
-                    elif response.status == 401:
-                        await update.message.reply_text(
-                            get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to upgrade!\nType /register to create your account.",
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        # Handle other errors, like user is already premium
-                        await update.message.reply_text(message)
+            async with self.backend.post(
+                "upgrade",
+                json={"user_id": telegram_id}
+            ) as response:
+                result = await response.json()
+                message = result.get("message", "An error occurred.")
 
-        except Exception as e:
-            print(f"❌ Error in upgrade command: {e}")
+                if response.status == 200 and result.get("success"):
+                    # Success! The message from the API will contain the payment link.
+                    await update.message.reply_text(
+                        message,
+                        parse_mode='Markdown',
+                        disable_web_page_preview=False # Ensure the link preview shows
+                    )
+                elif response.status == 401:
+                    await update.message.reply_text(
+                        get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to upgrade!\nType /register to create your account.",
+                        parse_mode='Markdown'
+                    )
+                else:
+                    # Handle other errors, like user is already premium
+                    await update.message.reply_text(message)
+
+        except Exception:
+            logger.exception("❌ Error in upgrade command")
             await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
 
 
 
     # --- 4. Add the support conversation methods ---
 
+    @track_handler
     async def support_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Starts the support conversation."""
         await update.message.reply_text(
@@ -373,16 +598,16 @@ class AgnoTelegramBot:
         )
         return SUPPORT_MESSAGE
 
+    @track_handler
     async def support_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Forwards the user's support message."""
         user = update.effective_user
         message_text = update.message.text
 
         if not self.support_chat_id:
-            print("⚠️ SUPPORT_CHAT_ID is not set. Cannot forward message.")
+            logger.warning("⚠️ SUPPORT_CHAT_ID is not set. Cannot forward message.")
             await update.message.reply_text("❌ We're sorry, the support system is currently unavailable. Please try again later.")
             return ConversationHandler.END
-        print("support id:", self.support_chat_id)
         # Format the message with user details
         forward_message = (
             f"**New Support Request**\n\n"
@@ -392,24 +617,25 @@ class AgnoTelegramBot:
             f"--- Message ---\n"
             f"{message_text}"
         )
-        print(forward_message)
         try:
             # Send the formatted message to your private support channel
             await self.app.bot.send_message(
                 chat_id=self.support_chat_id,
                 text=forward_message,
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                rate_limit_args={"priority": PRIORITY_BACKGROUND}  # Interactive replies go first
             )
             await update.message.reply_text(
                 get_message("support_message", update.effective_user.language_code),
                 parse_mode='Markdown'
             )
-        except Exception as e:
-            print(f"❌ Failed to forward support message: {e}")
+        except Exception:
+            logger.exception("❌ Failed to forward support message")
             await update.message.reply_text(get_message("generic_error", update.effective_user.language_code))
 
         return ConversationHandler.END
 
+    @track_handler
     async def support_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Cancels the support conversation."""
         await update.message.reply_text("Support request cancelled.")
@@ -417,11 +643,10 @@ class AgnoTelegramBot:
    
    
    # --- 5. User Interaction Handlers ---
+    @track_handler
     async def handle_audio_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Process audio messages with authentication"""
-        user = update.effective_user
-        telegram_id = str(user.id)
-        print(f"🎤 Audio message from {user.first_name}")
+        """Queue audio messages for transcription"""
+        logger.debug("🎤 Audio message")
 
         try:
             audio = update.message.voice or update.message.audio
@@ -429,353 +654,767 @@ class AgnoTelegramBot:
                 await update.message.reply_text("❌ No audio found in your message.")
                 return
 
-            file = await audio.get_file()
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as temp_file:
-                await file.download_to_drive(temp_file.name)
-
-                async with aiohttp.ClientSession() as session:
-                    with open(temp_file.name, 'rb') as f:
-                        data = aiohttp.FormData()
-                        data.add_field('user_id', telegram_id)
-                        data.add_field('file', f, filename='audio.ogg', content_type='audio/ogg')
-
-                        async with session.post(
-                            f"{self.api_url}/okanassist/v1/process-audio",
-                            data=data
-                        ) as response:
-                            if response.status == 200:
-                                result = await response.json()
-                                await update.message.reply_text(result.get("message", "✅ Audio processed!"), parse_mode='Markdown')
-                            elif response.status == 401:
-                                await update.message.reply_text(
-                                    get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to process audio!\nType /register to create your account.",
-                                    parse_mode='Markdown'
-                                )
-                            else:
-                                await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
-
-                os.unlink(temp_file.name)
+            await self.submit_job(update.message, "audio", file_id=audio.file_id)
+        except Exception:
+            logger.exception("❌ Error queueing audio")
+            await update.message.reply_text(get_message("generic_error", update.effective_user.language_code))
 
-        except Exception as e:
-            print(f"❌ Error processing audio: {e}")
-            await update.message.reply_text(get_message("generic_error", update.effective_user.language_code))    
-    
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle text messages with authentication check"""
-        user = update.effective_user
-        message = update.message.text
-        telegram_id = str(user.id)
-        
-        print(f"📱 Message from {user.first_name} ({user.id}): {message}")
-        
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
+    async def process_audio_job(self, job: Job):
+        """Background job: transcribe an audio message and send the result"""
+        language_code = job.payload["language_code"]
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/okanassist/v1/route-message",
-                    json={
-                        "user_id": telegram_id,
-                        "message": message,
-                        "user_data": user.to_dict(),
-                        "language_code": user.language_code # <-- Pass language
-                    }
+            file = await self.app.bot.get_file(job.payload["file_id"])
+            async with self.media.open(file, kind="audio") as payload:
+                data = aiohttp.FormData()
+                data.add_field('user_id', job.user_id)
+                data.add_field('file', payload, filename='audio.ogg', content_type='audio/ogg')
+
+                async with self.backend.post(
+                    "process-audio",
+                    data=data
                 ) as response:
                     if response.status == 200:
                         result = await response.json()
-                        await update.message.reply_text(result["message"], parse_mode='Markdown')
+                        await self.send_job_result(job, result.get("message", "✅ Audio processed!"), parse_mode='Markdown')
                     elif response.status == 401:
-                        # ✅ FIX: Handle 401 properly
-                        error_data = await response.json()
-                        error_message = error_data.get('detail', 'Authentication required')
-                        await update.message.reply_text(
-                            get_message("user_not_found", update.effective_user.language_code) + f"\n\n⚠️ {error_message}",
+                        await self.send_job_result(
+                            job,
+                            get_message("user_not_found", language_code) + "\n\n🔐 You need to register first to process audio!\nType /register to create your account.",
                             parse_mode='Markdown'
                         )
                     else:
-                        print(f"❌ Error processing message: {response.status}")
-                        await update.message.reply_text(
-                            get_message("generic_downtime", update.effective_user.language_code)
-                        )
-        except Exception as e:
-            print(f"❌ Error processing message: {e}")
+                        await self.send_job_result(job, get_message("generic_downtime", language_code))
+
+        except CircuitOpenError:
+            await self.send_job_result(job, get_message("generic_downtime", language_code))
+        except Exception:
+            logger.exception("❌ Error processing audio")
+            await self.send_job_result(job, get_message("generic_error", language_code))
+
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle text messages with authentication check"""
+        user = update.effective_user
+        message = update.message.text
+        telegram_id = str(user.id)
+        
+        logger.debug("📱 Text message", extra={"length": len(message)})
+        
+        try:
+            async with self.backend.post(
+                "route-message",
+                json={
+                    "user_id": telegram_id,
+                    "message": message,
+                    "user_data": user.to_dict(),
+                    "language_code": user.language_code # <-- Pass language
+                },
+                headers={"Accept": ACCEPT_STREAMING} if self.stream_replies else None,
+            ) as response:
+                if response.status == 200 and is_streaming(response):
+                    await self.reply_streamed(update, response)
+                elif response.status == 200:
+                    result = await response.json()
+                    await update.message.reply_text(result["message"], parse_mode='Markdown')
+                elif response.status == 401:
+                    # ✅ FIX: Handle 401 properly
+                    error_data = await response.json()
+                    error_message = error_data.get('detail', 'Authentication required')
+                    await update.message.reply_text(
+                        get_message("user_not_found", update.effective_user.language_code) + f"\n\n⚠️ {error_message}",
+                        parse_mode='Markdown'
+                    )
+                else:
+                    logger.warning("❌ Error processing message", extra={"status": response.status})
+                    await update.message.reply_text(
+                        get_message("generic_downtime", update.effective_user.language_code)
+                    )
+        except Exception:
+            logger.exception("❌ Error processing message")
             await update.message.reply_text(
                 get_message("generic_downtime", update.effective_user.language_code)
             )
     
+    async def reply_streamed(self, update: Update, response: aiohttp.ClientResponse):
+        """Reply with a message that grows as the backend streams its answer"""
+        language = update.effective_user.language_code
+        chat = update.effective_chat
+        reply = ProgressiveReply(
+            self.app.bot,
+            chat.id,
+            # Like reply_text: quote the user's message only outside private chats
+            reply_to_message_id=None if chat.type == chat.PRIVATE else update.message.message_id,
+            interval=self.stream_edit_interval,
+        )
+        text = ""
+        show_partials_at = time.monotonic() + self.stream_first_update_delay
+        try:
+            async for text in iter_text(response):
+                if time.monotonic() >= show_partials_at:
+                    # Unfinished Markdown may not parse, so partial text goes out plain
+                    await reply.update(text + " ▌")
+        except Exception:
+            logger.exception("❌ Streamed answer broke off", extra={"received": len(text)})
+            await reply.finish(get_message("generic_downtime", language))
+            return
+        if not text:
+            logger.warning("❌ Streamed answer was empty")
+            await reply.finish(get_message("generic_downtime", language))
+            return
+        await reply.finish(text, parse_mode='Markdown')
+
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
         user = update.effective_user
-        print(f"ℹ️ /help command from {user.first_name}")
+        logger.debug("ℹ️ /help command")
         
+        language_code = user.language_code or "en"
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.api_url}/okanassist/v1/help",
-                    params={"language_code": user.language_code} # <-- Pass language
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        await update.message.reply_text(result["message"], parse_mode='Markdown')
-                    else:
-                        await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
-        except Exception as e:
-            print(f"❌ Error in help command: {e}")
+            status, result = await self.responses.get_or_fetch(
+                "help", language_code,
+                lambda: self.backend.fetch_json("GET", "help", params={"language_code": language_code})
+            )
+            if status == 200:
+                await update.message.reply_text(result["message"], parse_mode='Markdown')
+            else:
+                await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
+        except Exception:
+            logger.exception("❌ Error in help command")
             await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
 
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
     async def balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /balance command with authentication"""
         user = update.effective_user
         telegram_id = str(user.id)
-        print(f"💰 /balance command from {user.first_name}")
+        logger.debug("💰 /balance command")
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/okanassist/v1/get-transaction-summary",
-                    json={"user_id": telegram_id, "days": 30}
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        await update.message.reply_text(result["message"], parse_mode='Markdown')
-                    elif response.status == 401:
-                        await update.message.reply_text(
-                            get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to view your balance!\nType /register to create your account.",
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        await update.message.reply_text(
-                            get_message("generic_downtime", update.effective_user.language_code)
-                        )
-        except Exception as e:
-            print(f"❌ Error in balance command: {e}")
+            status, result = await self.backend.fetch_json(
+                "POST", "get-transaction-summary",
+                json={"user_id": telegram_id, "days": 30}
+            )
+            if status == 200:
+                await update.message.reply_text(result["message"], parse_mode='Markdown')
+            elif status == 401:
+                await update.message.reply_text(
+                    get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to view your balance!\nType /register to create your account.",
+                    parse_mode='Markdown'
+                )
+            else:
+                await update.message.reply_text(
+                    get_message("generic_downtime", update.effective_user.language_code)
+                )
+        except Exception:
+            logger.exception("❌ Error in balance command")
             await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
 
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
     async def reminders_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /reminders command with authentication"""
         user = update.effective_user
         telegram_id = str(user.id)
-        print(f"⏰ /reminders command from {user.first_name}")
+        logger.debug("⏰ /reminders command")
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/okanassist/v1/get-reminders",
-                    params={"user_id": telegram_id, "limit": 10}
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        await update.message.reply_text(result["message"], parse_mode='Markdown')
-                    elif response.status == 401:
-                        await update.message.reply_text(
-                            get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to view your reminders!\nType /register to create your account.",
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        await update.message.reply_text(
-                            get_message("generic_downtime", update.effective_user.language_code)
-                        )
-        except Exception as e:
-            print(f"❌ Error in reminders command: {e}")
+            status, result = await self.backend.fetch_json(
+                "POST", "get-reminders",
+                params={"user_id": telegram_id, "limit": 10}
+            )
+            if status == 200:
+                await update.message.reply_text(result["message"], parse_mode='Markdown')
+            elif status == 401:
+                await update.message.reply_text(
+                    get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to view your reminders!\nType /register to create your account.",
+                    parse_mode='Markdown'
+                )
+            else:
+                await update.message.reply_text(
+                    get_message("generic_downtime", update.effective_user.language_code)
+                )
+        except Exception:
+            logger.exception("❌ Error in reminders command")
             await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
 
+    @track_handler
     async def handle_receipt_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Process receipt photos with authentication"""
+        """Queue receipt photos for OCR"""
         user = update.effective_user
         telegram_id = str(user.id)
-        print(f"📸 Receipt photo from {user.first_name}")
+        logger.debug("📸 Receipt photo")
         
         try:
-            # Download photo
+            if update.message.media_group_id:
+                # Part of an album: the whole album goes to the backend in one request
+                self.albums.add((telegram_id, update.message.media_group_id), update.message)
+                return
+
             photo = update.message.photo[-1]
-            file = await photo.get_file()
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-                await file.download_to_drive(temp_file.name)
-                
-                # Send to API
-                async with aiohttp.ClientSession() as session:
-                    with open(temp_file.name, 'rb') as f:
-                        data = aiohttp.FormData()
-                        data.add_field('user_id', telegram_id)
-                        data.add_field('file', f, filename='receipt.jpg', content_type='image/jpeg')
-                        
-                        async with session.post(
-                            f"{self.api_url}/okanassist/v1/process-receipt",
-                            data=data
-                        ) as response:
-                            if response.status == 200:
-                                result = await response.json()
-                                await update.message.reply_text(result["message"], parse_mode='Markdown')
-                            elif response.status == 401:
-                                await update.message.reply_text(
-                                    get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to process receipts!\nType /register to create your account.",
-                                    parse_mode='Markdown'
-                                )
-                            else:
-                                await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
-                
-                # Cleanup
-                os.unlink(temp_file.name)
-                
-        except Exception as e:
-            print(f"❌ Error processing receipt: {e}")
+
+            # Same photo resent or forwarded: answer with the earlier result
+            cached_message = self.media_results.get((telegram_id, photo.file_unique_id))
+            if cached_message:
+                logger.info("♻️ Duplicate receipt, answering from cache")
+                await update.message.reply_text(cached_message, parse_mode='Markdown')
+                return
+
+            await self.submit_job(update.message, "receipt", photos=[
+                {"file_id": photo.file_id, "file_unique_id": photo.file_unique_id}
+            ])
+        except Exception:
+            logger.exception("❌ Error queueing receipt")
             await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
 
+    @track_handler
+    async def process_receipt_album(self, messages: List[Message]):
+        """Queue the photos of an album as one receipt job, answered with one reply"""
+        first = messages[0]
+        telegram_id = str(first.from_user.id)
+        photos = [message.photo[-1] for message in messages]
+        logger.debug("📸 Receipt album", extra={"photos": len(photos)})
+
+        # Same album resent or forwarded: answer with the earlier result
+        cached_message = self.media_results.get((telegram_id, tuple(sorted(photo.file_unique_id for photo in photos))))
+        if cached_message:
+            logger.info("♻️ Duplicate receipt album, answering from cache")
+            await first.reply_text(cached_message, parse_mode='Markdown')
+            return
+
+        await self.submit_job(first, "receipt", photos=[
+            {"file_id": photo.file_id, "file_unique_id": photo.file_unique_id} for photo in photos
+        ])
+
+    async def _post_receipts(self, telegram_id: str, files: List[Any]) -> tuple:
+        """POST one photo to process-receipt, or several to process-receipt-batch; returns (status, body)"""
+        async with contextlib.AsyncExitStack() as stack:
+            # Opened one at a time so a failed download leaves only registered opens to close;
+            # large photos are still streamed into the upload as they arrive
+            payloads = [await stack.enter_async_context(self.media.open(file, kind="receipt")) for file in files]
+            data = aiohttp.FormData()
+            data.add_field('user_id', telegram_id)
+            if len(payloads) == 1:
+                endpoint = "process-receipt"
+                data.add_field('file', payloads[0], filename='receipt.jpg', content_type='image/jpeg')
+            else:
+                endpoint = "process-receipt-batch"
+                for index, payload in enumerate(payloads, 1):
+                    data.add_field('files', payload, filename=f'receipt-{index}.jpg', content_type='image/jpeg')
+
+            async with self.backend.post(endpoint, data=data) as response:
+                if response.status != 200:
+                    return response.status, {}
+                return response.status, await response.json()
+
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
+    async def process_receipt_job(self, job: Job):
+        """Background job: OCR a receipt photo or an album and send the result as one reply"""
+        telegram_id = job.user_id
+        language_code = job.payload["language_code"]
+        photos = job.payload["photos"]
+        if len(photos) == 1:
+            cache_key = (telegram_id, photos[0]["file_unique_id"])
+        else:
+            cache_key = (telegram_id, tuple(sorted(photo["file_unique_id"] for photo in photos)))
+
+        try:
+            files = await asyncio.gather(*(self.app.bot.get_file(photo["file_id"]) for photo in photos))
+
+            results = None
+            if len(files) > 1 and self.receipt_batch_requests:
+                status, body = await self._post_receipts(telegram_id, files)
+                if status in (404, 405):
+                    logger.warning("⚠️ Backend has no process-receipt-batch, sending album photos one by one")
+                    self.receipt_batch_requests = False
+                else:
+                    results = [(status, body)]
+            if results is None:
+                results = [await self._post_receipts(telegram_id, [file]) for file in files]
+
+            if any(status == 401 for status, _ in results):
+                await self.send_job_result(
+                    job,
+                    get_message("user_not_found", language_code) + "\n\n🔐 You need to register first to process receipts!\nType /register to create your account.",
+                    parse_mode='Markdown'
+                )
+                return
+
+            messages = [body["message"] for status, body in results if status == 200]
+            if not messages:
+                await self.send_job_result(job, get_message("generic_downtime", language_code))
+                return
+            if len(messages) == len(results):
+                self.media_results.set(cache_key, "\n\n".join(messages))
+            else:
+                messages.append(get_message("generic_downtime", language_code))
+            await self.send_job_result(job, "\n\n".join(messages), parse_mode='Markdown')
+
+        except Exception:
+            logger.exception("❌ Error processing receipt")
+            await self.send_job_result(job, get_message("generic_downtime", language_code))
+
+    @track_handler
+    @sends_chat_action(ChatAction.UPLOAD_DOCUMENT)
     async def handle_pdf_statement(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Process bank statement PDFs with authentication"""
         user = update.effective_user
         telegram_id = str(user.id)
-        print(f"📄 PDF statement from {user.first_name}")
+        logger.debug("📄 PDF statement")
         
         try:
             document = update.message.document
+
+            # Same statement resent or forwarded: answer with the earlier result
+            cache_key = (telegram_id, document.file_unique_id)
+            cached_message = self.media_results.get(cache_key)
+            if cached_message:
+                logger.info("♻️ Duplicate PDF, answering from cache")
+                await update.message.reply_text(cached_message, parse_mode='Markdown')
+                return
+
+            if self.statement_upload_mode == "chunked":
+                job_key = f"statement:{telegram_id}:{document.file_unique_id}"
+                if self.jobs.active(job_key):
+                    await update.message.reply_text(
+                        get_message("statement_processing", update.effective_user.language_code)
+                    )
+                    return
+                # The job edits this message with progress and the result
+                status_message = await update.message.reply_text(
+                    get_message("statement_uploading", update.effective_user.language_code, percent=0)
+                )
+                await self.submit_job(
+                    update.message, "statement", key=job_key,
+                    file_id=document.file_id, file_unique_id=document.file_unique_id,
+                    file_name=document.file_name or 'statement.pdf', status_message_id=status_message.message_id,
+                )
+                return
+
             file = await document.get_file()
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                await file.download_to_drive(temp_file.name)
-                
-                # Send to API
-                async with aiohttp.ClientSession() as session:
-                    with open(temp_file.name, 'rb') as f:
-                        data = aiohttp.FormData()
-                        data.add_field('user_id', telegram_id)
-                        data.add_field('file', f, filename=document.file_name, content_type='application/pdf')
-                        
-                        async with session.post(
-                            f"{self.api_url}/okanassist/v1/process-bank-statement",
-                            data=data
-                        ) as response:
-                            if response.status == 200:
-                                result = await response.json()
-                                await update.message.reply_text(result["message"], parse_mode='Markdown')
-                            elif response.status == 401:
-                                await update.message.reply_text(
-                                    get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to process documents!\nType /register to create your account.",
-                                    parse_mode='Markdown'
-                                )
-                            else:
-                                await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
-                
-                # Cleanup
-                os.unlink(temp_file.name)
+            status, body = await self._post_statement(telegram_id, file, document.file_name or 'statement.pdf')
+            if status == 200:
+                self.media_results.set(cache_key, body["message"])
+                await update.message.reply_text(body["message"], parse_mode='Markdown')
+            elif status == 401:
+                await update.message.reply_text(
+                    get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to process documents!\nType /register to create your account.",
+                    parse_mode='Markdown'
+                )
+            else:
+                await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
                 
-        except Exception as e:
-            print(f"❌ Error processing PDF: {e}")
+        except CircuitOpenError:
+            await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
+        except Exception:
+            logger.exception("❌ Error processing PDF")
             await update.message.reply_text(get_message("generic_error", update.effective_user.language_code))
 
+    async def _post_statement(self, telegram_id: str, file: Any, file_name: str) -> tuple:
+        """POST a whole statement to process-bank-statement, streamed from Telegram; returns (status, body)"""
+        async with self.media.open(file, kind="statement") as payload:
+            data = aiohttp.FormData()
+            data.add_field('user_id', telegram_id)
+            data.add_field('file', payload, filename=file_name, content_type='application/pdf')
+
+            async with self.backend.post("process-bank-statement", data=data) as response:
+                if response.status != 200:
+                    return response.status, {}
+                return response.status, await response.json()
+
+    @track_handler
+    @sends_chat_action(ChatAction.UPLOAD_DOCUMENT)
+    async def process_statement_job(self, job: Job):
+        """Background job: chunked upload and import of a statement, reported by editing its status message"""
+        telegram_id = job.user_id
+        language_code = job.payload["language_code"]
+        status = ProgressiveReply(
+            self.app.bot, job.payload["chat_id"], message_id=job.payload["status_message_id"],
+            text=get_message("statement_uploading", language_code, percent=0), priority=PRIORITY_BACKGROUND,
+        )
+
+        async def on_progress(stage: str, fraction: float):
+            # Progress is cosmetic: a failed edit must not abort the upload
+            try:
+                if stage == "uploading":
+                    await status.update(get_message("statement_uploading", language_code, percent=int(fraction * 100)))
+                else:
+                    await status.finish(get_message("statement_processing", language_code))
+            except TelegramError as e:
+                logger.warning("⚠️ Could not show statement progress: %s", e)
+
+        try:
+            file = await self.app.bot.get_file(job.payload["file_id"])
+            try:
+                result = await self.statements.upload(
+                    file, telegram_id, job.payload["file_name"],
+                    resume_key=f"{telegram_id}:{job.payload['file_unique_id']}", on_progress=on_progress,
+                )
+            except UploadsUnsupported:
+                logger.warning("⚠️ Backend has no chunked statement uploads, posting statements in one request")
+                self.statement_upload_mode = "single"
+                await on_progress("processing", 1.0)
+                code, result = await self._post_statement(telegram_id, file, job.payload["file_name"])
+                if code != 200:
+                    raise UploadError(code)
+            self.media_results.set((telegram_id, job.payload["file_unique_id"]), result["message"])
+            await status.finish(result["message"], parse_mode='Markdown')
+        except UploadError as e:
+            if e.status == 401:
+                await status.finish(
+                    get_message("user_not_found", language_code) + "\n\n🔐 You need to register first to process documents!\nType /register to create your account.",
+                    parse_mode='Markdown'
+                )
+            else:
+                logger.warning("⚠️ Statement import failed: %s", e)
+                await status.finish(get_message("generic_downtime", language_code))
+        except CircuitOpenError:
+            await status.finish(get_message("generic_downtime", language_code))
+        except Exception:
+            logger.exception("❌ Error importing PDF")
+            await status.finish(get_message("generic_error", language_code))
+
+    async def submit_job(self, message: Message, kind: str, key: Optional[str] = None, **payload) -> bool:
+        """Queue background processing of ``message``; tells the user if it has to wait or can't be queued"""
+        language_code = message.from_user.language_code
+        try:
+            ahead = await self.jobs.submit(kind, str(message.from_user.id), {
+                "chat_id": message.chat_id,
+                "message_id": message.message_id,
+                "language_code": language_code,
+                **payload,
+            }, key=key)
+        except QueueFull:
+            await message.reply_text(get_message("job_queue_full", language_code))
+            return False
+        if ahead:
+            await message.reply_text(get_message("job_queued", language_code, position=ahead))
+        return True
+
+    async def send_job_result(self, job: Job, text: str, **kwargs):
+        """Answer the message a job was submitted for"""
+        await self.app.bot.send_message(
+            job.payload["chat_id"], text,
+            reply_parameters=ReplyParameters(job.payload["message_id"], allow_sending_without_reply=True),
+            # Replies to interactive commands go first when the global send budget is short
+            rate_limit_args={"priority": PRIORITY_BACKGROUND},
+            **kwargs,
+        )
+
+    @track_handler
+    @sends_chat_action(ChatAction.TYPING)
     async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /profile command with authentication"""
         user = update.effective_user
         telegram_id = str(user.id)
-        print(f"👤 /profile command from {user.first_name}")
+        logger.debug("👤 /profile command")
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.api_url}/okanassist/v1/profile",
-                    params={"user_id": telegram_id}
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        print(result)
-                        user_data = result.get("user_data", {})
-
-                        # --- 2. Build and escape the message here ---
-                        # Use escape_markdown(text, version=2) for V2 Markdown
-                        email = escape_markdown(user_data.get('email', 'Not set'), version=2)
-                        name = escape_markdown(user_data.get('name', 'Unknown'), version=2)
-                        
-                        language = escape_markdown(user_data.get('language', 'en'), version=2)
-                        currency = escape_markdown(user_data.get('currency', 'USD'), version=2)
-                        timezone = escape_markdown(user_data.get('timezone', 'UTC'), version=2)
-                        premium_status = 'Yes' if user_data.get('is_premium') else 'No'
-
-                        profile_message = get_message(
-                            "profile_info", update.effective_user.language_code,
-                            email=email,
-                            name=name,
-                            language=language,
-                            currency=currency,
-                            timezone=timezone,
-                            premium_status=premium_status
-                        )
-                        # FIX: Access manage_url from the top-level result, not user_data
-                        manage_url = None
-                        is_premium = user_data.get('is_premium', False)
-                        if is_premium:
-                            manage_url = result.get('manage_url', {}).get('portal_url', '')
-                            profile_message += get_message("manage_url", update.effective_user.language_code, url=manage_url)+"\n\n"    
-                        await update.message.reply_text(profile_message, parse_mode='MarkdownV2')
+            status, result = await self.responses.get_or_fetch(
+                "profile", telegram_id,
+                lambda: self.backend.fetch_json("GET", "profile", params={"user_id": telegram_id})
+            )
+            if status == 200:
+                user_data = result.get("user_data", {})
+
+                # --- 2. Build the message; values are escaped for MarkdownV2 by the catalog ---
+                premium_status = 'Yes' if user_data.get('is_premium') else 'No'
+
+                profile_message = get_message(
+                    "profile_info", update.effective_user.language_code,
+                    escape="MarkdownV2",
+                    email=user_data.get('email', 'Not set'),
+                    name=user_data.get('name', 'Unknown'),
+                    language=user_data.get('language', 'en'),
+                    currency=user_data.get('currency', 'USD'),
+                    timezone=user_data.get('timezone', 'UTC'),
+                    premium_status=premium_status
+                )
+                # FIX: Access manage_url from the top-level result, not user_data
+                manage_url = None
+                is_premium = user_data.get('is_premium', False)
+                if is_premium:
+                    manage_url = result.get('manage_url', {}).get('portal_url', '')
+                    profile_message += get_message("manage_url", update.effective_user.language_code, url=manage_url)+"\n\n"    
+                await update.message.reply_text(profile_message, parse_mode='MarkdownV2')
                     
-                    elif response.status == 401:
-                        await update.message.reply_text(
-                            get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to view your profile!\nType /register to create your account.",
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        await update.message.reply_text(
-                            get_message("generic_error", update.effective_user.language_code)
-                        )
-        except Exception as e:
-            print(f"❌ Error in profile command: {e}")
+            elif status == 401:
+                await update.message.reply_text(
+                    get_message("user_not_found", update.effective_user.language_code) + "\n\n🔐 You need to register first to view your profile!\nType /register to create your account.",
+                    parse_mode='Markdown'
+                )
+            else:
+                await update.message.reply_text(
+                    get_message("generic_error", update.effective_user.language_code)
+                )
+        except CircuitOpenError:
+            await update.message.reply_text(get_message("generic_downtime", update.effective_user.language_code))
+        except Exception:
+            logger.exception("❌ Error in profile command")
             await update.message.reply_text(get_message("generic_error", update.effective_user.language_code))
     
-    async def set_commands(self, language_code="en"):
-        """Set bot commands based on language"""
-        lang_short = language_code.split('-')[0] if language_code else 'en'
-        commands_data = MESSAGES.get(lang_short, MESSAGES['en']).get("commands", MESSAGES['en']["commands"])
-        commands = [
-            BotCommand(cmd["name"], cmd["description"])
-            for cmd in commands_data.values()
-        ]
-        await self.app.bot.set_my_commands(commands)
+    @staticmethod
+    def command_menus() -> Dict[Optional[str], list]:
+        """Command menu per language code; the ``None`` entry is the default for other languages"""
+        menus: Dict[Optional[str], list] = {
+            lang: [BotCommand(cmd["name"], cmd["description"]) for cmd in messages["commands"].values()]
+            for lang, messages in MESSAGES.items()
+        }
+        menus[None] = menus[DEFAULT_LANGUAGE]
+        return menus
+
+    async def set_commands(self):
+        """Register the command menu of every language whose menu Telegram doesn't already have.
+
+        Telegram's current menus are read with getMyCommands, and only those that differ are
+        set, so a fresh instance of an unchanged deployment makes no setMyCommands calls. The
+        hash of the registered menus is also kept in the state store; that saves the reads too,
+        but only across restarts that keep the store (a durable STATE_STORE=sqlite file).
+        """
+        menus = self.command_menus()
+        digest = hashlib.sha256(json.dumps(
+            {lang or "": [command.to_dict() for command in commands] for lang, commands in menus.items()},
+            sort_keys=True, ensure_ascii=False,
+        ).encode()).hexdigest()
+        meta_key = f"commands:{self.app.bot.id}"
+        if await self.state_store.get("bot_meta", meta_key) == digest:
+            logger.info("📋 Command menus unchanged, skipping registration")
+            return
+
+        current = await asyncio.gather(
+            *(self.app.bot.get_my_commands(language_code=lang) for lang in menus), return_exceptions=True
+        )
+        stale = {
+            lang: commands for (lang, commands), existing in zip(menus.items(), current)
+            if isinstance(existing, Exception) or tuple(existing) != tuple(commands)
+        }
+        results = await asyncio.gather(
+            *(self.app.bot.set_my_commands(commands, language_code=lang) for lang, commands in stale.items()),
+            return_exceptions=True,
+        )
+        failed = [lang or "default" for lang, result in zip(stale, results) if isinstance(result, Exception)]
+        if failed:
+            # Not fatal: the menus from the previous deployment stay in place until the next boot
+            logger.warning("⚠️ Could not register command menus", extra={"languages": failed})
+            return
+        await self.state_store.set("bot_meta", meta_key, digest, ttl=0)
+        logger.info("📋 Command menus registered", extra={"languages": [lang or "default" for lang in stale]})
+
+    async def forward_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ingress: hand the update to the worker process that owns its user"""
+        key = PerUserUpdateProcessor.ordering_key(update)
+        self.worker_pool.dispatch(update.to_dict(), key[1] if key else 0)
+
+    async def telegram_webhook(self, request: web.Request) -> web.Response:
+        """Receive an update from Telegram and hand it to the application's update queue"""
+        secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(secret.encode(), (self.webhook_secret or "").encode()):
+            return web.Response(status=403, text="Forbidden")
+        if not self.accepting_updates:
+            # Telegram redelivers the update later, to an instance that isn't shutting down
+            return web.Response(status=503, text="Shutting down")
+
+        try:
+            payload = await request.json()
+            if self.worker_pool:
+                # Routed on the raw payload; only the owning worker decodes it into an Update
+                self.worker_pool.dispatch(payload)
+                return web.Response(text="OK")
+            update = Update.de_json(payload, self.app.bot)
+        except Exception as e:
+            logger.warning("❌ Invalid webhook payload: %s", e)
+            return web.Response(status=400, text="Bad Request")
+
+        await self.app.update_queue.put(update)
+        return web.Response(text="OK")
+
+    async def start_ingestion(self):
+        """Start receiving updates via long polling or by registering the webhook"""
+        if self.bot_mode == "webhook":
+            webhook_endpoint = self.webhook_url.rstrip('/') + self.webhook_path
+            await self.app.bot.set_webhook(
+                url=webhook_endpoint,
+                secret_token=self.webhook_secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info("🪝 Webhook registered", extra={"url": webhook_endpoint})
+        else:
+            await self.app.updater.start_polling()
+            logger.info("🔄 Long polling started")
+
+    async def stop_ingestion(self):
+        """Stop receiving updates. The webhook stays registered so Telegram can wake us up."""
+        if self.app.updater and self.app.updater.running:
+            await self.app.updater.stop()
+
+    async def drain(self):
+        """Stop intake and give queued and in-flight work until the shutdown deadline to finish.
+
+        Updates, albums, jobs, worker processes and queued replies all share one deadline,
+        computed once from SHUTDOWN_GRACE_PERIOD, so the whole drain ends before SIGKILL.
+        """
+        started = time.monotonic()
+        deadline = started + self.shutdown_grace_period - SHUTDOWN_EXIT_RESERVE
+        # Handlers must be done early enough to leave their replies time to be sent
+        work_deadline = min(started + self.drain_timeout, deadline - self.send_drain_timeout)
+
+        def remaining(until: float) -> float:
+            return max(0.0, until - time.monotonic())
+
+        self.accepting_updates = False
+        self.health.draining = True
+        await self.stop_ingestion()
 
-    async def run(self):
-        """Start the bot and HTTP server"""
+        try:
+            # task_done() is called for every update once its handler has returned; on an
+            # ingress that is just forwarding, so the workers are told to stop right after
+            await asyncio.wait_for(self.app.update_queue.join(), timeout=remaining(work_deadline))
+            logger.info(
+                "✅ In-flight updates drained", extra={"duration_ms": round((time.monotonic() - started) * 1000)}
+            )
+        except asyncio.TimeoutError:
+            cancelled = self.update_processor.cancel_all()
+            logger.warning("⏱️ Drain deadline reached, cancelled %d updates", cancelled)
+        if self.worker_pool:
+            # Workers drain in parallel with the rest of this process, on their own shorter deadline
+            self.worker_pool.request_stop()
+
+        # Albums still inside their collection window are processed now rather than dropped
+        if self.albums.pending:
+            try:
+                await asyncio.wait_for(
+                    self.albums.flush_all(), timeout=remaining(work_deadline)
+                )
+            except asyncio.TimeoutError:
+                logger.warning("⏱️ Drain deadline reached with receipt albums still processing")
+
+        # Background jobs get the rest of the deadline; the job store is local to this instance,
+        # so a job cancelled here may never run again if the instance is replaced
+        if self.jobs and (self.jobs.queued or self.jobs.running):
+            try:
+                await asyncio.wait_for(
+                    self.jobs.join(), timeout=remaining(work_deadline)
+                )
+                logger.info("✅ Background jobs drained")
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "⏱️ Drain deadline reached with background jobs unfinished",
+                    extra={"queued": self.jobs.queued, "running": self.jobs.running},
+                )
+
+        if self.worker_pool:
+            await self.worker_pool.stop(timeout=remaining(deadline))
+
+        # Replies of handlers that just finished may still be waiting for a send token
+        if not await self.send_scheduler.drain(remaining(deadline)):
+            logger.warning(
+                "⏱️ Outgoing messages still queued at shutdown", extra={"pending": self.send_scheduler.pending}
+            )
+
+    async def start_components(self):
+        """Open the backend pool and start the Telegram application (no ingestion yet)"""
         if not self.app:
             self.setup()
+        await self.backend.start()
+        await self.app.initialize()
+        await self.app.start()
+        if self.jobs:
+            await self.jobs.start()
+
+    async def stop_components(self):
+        """Stop the application and release everything start_components() acquired"""
+        if self.jobs:
+            # Only jobs that outlasted the drain deadline are cancelled; they stay on disk and
+            # resume if this instance (or its disk) is started again
+            await self.jobs.stop()
+            await self.job_store.close()
+        if self.app.running:
+            await self.app.stop()
+        # Writes pending conversation states to the persistence before the store is closed
+        await self.app.shutdown()
+        await self.state_store.close()
+        await self.backend.close()
+
+    async def _deferred_startup(self):
+        """Work that doesn't gate serving updates; runs alongside the first ones"""
+        try:
+            with PROFILE.phase("set_commands (deferred)"):
+                await self.set_commands()
+        except Exception:
+            logger.exception("❌ Deferred startup work failed")
+
+    async def run(self, server: Optional[EarlyServer] = None):
+        """Start the bot and HTTP server.
+
+        ``server`` is an already bound EarlyServer (see main.py); otherwise one is bound here
+        first. Probes are answered from the moment the port is bound, and the Bot API is only
+        called for what is needed to receive updates before ingestion starts.
+        """
+        if server is None:
+            server = EarlyServer()
+            with PROFILE.phase("bind_port"):
+                await server.start()
+        with PROFILE.phase("setup"):
+            if not self.app:
+                self.setup()
         
-        await self.set_commands(language_code="en")
-        
-        print("🤖 Telegram Bot started!")
-        print("🎯 Commands: /start, /register, /help, /balance, /reminders, /profile")
-        print("📸 Send photos of receipts for automatic processing")
-        print("📄 Send PDF bank statements for bulk transaction import")
-        
-        # Create a simple HTTP server for Cloud Run health checks
-        async def health_check(request):
-            return web.Response(text="Bot is running")
-        
-        web_app = web.Application()
-        web_app.router.add_get('/health', health_check)
-        
-        # Get the port from environment (default 8080 for Cloud Run)
-        port = int(os.getenv('PORT', 8080))
-        
-        # Start both the bot and the web server concurrently
-        async with self.app:
-            await self.app.start()
-            await self.app.updater.start_polling()
-            
-            # Start the web server
-            runner = web.AppRunner(web_app)
-            await runner.setup()
-            site = web.TCPSite(runner, '0.0.0.0', port)
-            await site.start()
-            print(f"🌐 HTTP server started on port {port}")
-            
+        logger.info("🤖 Telegram Bot started!")
+        server.add_get('/metrics', self.worker_pool.metrics_endpoint if self.worker_pool else metrics_endpoint)
+
+        with PROFILE.phase("start_components"):
+            await self.start_components()
+        if self.worker_pool:
+            with PROFILE.phase("start_workers"):
+                self.worker_pool.start()
+        self.health.start()
+
+        # /health is kept as the liveness probe
+        server.add_get('/health', self.health.live)
+        server.add_get('/health/live', self.health.live)
+        server.add_get('/health/ready', self.health.ready)
+        if self.bot_mode == "webhook":
+            server.add_post(self.webhook_path, self.telegram_webhook)
+        server.ready = True
+
+        stop_requested = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
             try:
-                while True:
-                    await asyncio.sleep(1)
-            except KeyboardInterrupt:
-                print("\n🛑 Stopping bot...")
-            finally:
-                await self.app.updater.stop()
-                await self.app.stop()
-                await runner.cleanup()
+                loop.add_signal_handler(sig, stop_requested.set)
+            except NotImplementedError:  # Windows: Ctrl+C still raises KeyboardInterrupt
+                pass
+
+        with PROFILE.phase("start_ingestion"):
+            await self.start_ingestion()
+        self.health.ingestion_started = True
+        PROFILE.complete()
+        deferred = asyncio.create_task(self._deferred_startup(), name="deferred_startup")
+        
+        try:
+            if self.startup_profile_only:
+                await deferred
+                logger.info("🚀 Startup profile", extra={"startup": PROFILE.report()})
+                stop_requested.set()
+            await stop_requested.wait()
+            logger.info("🛑 Stop requested, draining in-flight updates...")
+            await self.drain()
+        finally:
+            deferred.cancel()
+            await self.stop_ingestion()
+            await self.health.stop()
+            await self.stop_components()
+            # Last, so probes and webhook 503s are answered during the drain
+            await server.cleanup()
+            logger.info("👋 Bot stopped")
 
 # --- Main block to run the bot ---
 if __name__ == "__main__":
+    configure_logging()
     bot = AgnoTelegramBot()
     asyncio.run(bot.run())
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import hmac
+import hashlib
+import logging
+import functools
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+# Per-update fields attached to every record logged while the update is handled
+log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+# Attributes every LogRecord has; anything else was passed through ``extra=``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+
+@functools.lru_cache(maxsize=1)
+def _user_hash_key() -> bytes:
+    """LOG_USER_HASH_SALT, or a key derived from the bot token; read on first use, after .env is loaded"""
+    salt = os.getenv('LOG_USER_HASH_SALT')
+    if salt:
+        return salt.encode()
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        raise ValueError("LOG_USER_HASH_SALT or TELEGRAM_BOT_TOKEN is required to hash user ids in logs")
+    return hashlib.sha256(b"log-user-hash:" + token.encode()).digest()
+
+
+def hash_user(user_id: Any) -> str:
+    """Stable, non-reversible user identifier for logs.
+
+    Keyed with a secret: Telegram ids are small integers, so an unkeyed hash would be
+    reversed by trying them all.
+    """
+    return hmac.new(_user_hash_key(), str(user_id).encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def bind(**fields: Any) -> contextvars.Token:
+    """Add fields to the log context of the current task; pass the token to ``log_context.reset``"""
+    return log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto the record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING; warnings and errors are always kept.
+
+    Records of one update are kept or dropped together, so a sampled update is complete.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        update_id = getattr(record, "update_id", None)
+        if update_id is None:
+            return random.random() < self.rate
+        return (hash(update_id) % 10000) < self.rate * 10000
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any context/extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the event loop: if the writer thread falls behind, records are dropped"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    """Route all logging through a bounded queue to a background writer thread.
+
+    LOG_LEVEL (INFO), LOG_FORMAT (json|text), LOG_SAMPLE_RATE (1.0) and LOG_QUEUE_SIZE (10000)
+    are read from the environment. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    sample_rate = float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+    queue_size = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+        formatter: logging.Formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    # Formatting happens on the caller's side (so the context is still current);
+    # only the write to stdout is left to the listener thread.
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.setFormatter(formatter)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    # Third-party libraries are noisy at INFO (every Bot API call, every access log line)
+    for name in ("httpx", "httpcore", "telegram", "aiohttp.access"):
+        logging.getLogger(name).setLevel(max(logging.getLevelName(level), logging.WARNING))
+
+    _listener = QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
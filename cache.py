@@ -0,0 +1,126 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Bounded in-memory cache with per-entry expiry and least-recently-used eviction"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]):
+        """Drop every entry whose key matches ``predicate``"""
+        for key in [k for k in self._data if predicate(k)]:
+            del self._data[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one cancelled caller doesn't cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+
+class ResponseCache:
+    """Caches successful backend GET responses per endpoint, with single-flight loading.
+
+    Entries are keyed on ``(endpoint, scope)`` where scope is whatever the response depends on
+    (a language code for /help, a telegram_id for /profile).
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_entries: int = 10000):
+        self.ttls = ttls
+        self._cache = TTLCache(max_entries=max_entries)
+        self._flight = SingleFlight()
+        self._generation = 0  # Bumped on invalidation so in-flight loads don't store stale data
+
+    async def get_or_fetch(
+        self,
+        endpoint: str,
+        scope: Hashable,
+        fetch: Callable[[], Awaitable[Tuple[int, Any]]],
+    ) -> Tuple[int, Any]:
+        """Return a cached ``(status, body)`` or call ``fetch`` once for all concurrent callers"""
+        key = (endpoint, scope)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        async def load():
+            generation = self._generation
+            status, body = await fetch()
+            ttl = self.ttls.get(endpoint, 0)
+            if status == 200 and ttl > 0 and generation == self._generation:
+                self._cache.set(key, (status, body), ttl=ttl)
+            return status, body
+
+        return await self._flight.do(key, load)
+
+    def invalidate(self, endpoint: Optional[str] = None, scope: Optional[Hashable] = None):
+        """Drop cached responses for an endpoint, a scope (e.g. one user), or both"""
+        self._generation += 1
+        self._cache.delete_where(
+            lambda key: (endpoint is None or key[0] == endpoint) and (scope is None or key[1] == scope)
+        )
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def __len__(self) -> int:
+        return len(self._cache)
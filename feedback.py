@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from typing import Any, Callable, Optional, Union
+from telegram import Bot, ReplyParameters, Update
+from telegram.error import BadRequest, TelegramError
+
+from jobs import Job
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+class ChatActionHeartbeat:
+    """Keeps a chat action ("typing…", "sending a file…") visible while slow work is pending.
+
+    The first action goes out after CHAT_ACTION_DELAY seconds, so fast answers send none, and
+    is repeated every CHAT_ACTION_INTERVAL seconds because Telegram shows one for about 5s,
+    for at most CHAT_ACTION_MAX_DURATION seconds.
+    """
+
+    def __init__(self, bot: Bot, chat_id: Union[int, str], action: str):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.action = action
+        self.delay = float(os.getenv('CHAT_ACTION_DELAY', 0.5))
+        self.interval = float(os.getenv('CHAT_ACTION_INTERVAL', 4.5))
+        self.max_duration = float(os.getenv('CHAT_ACTION_MAX_DURATION', 120))
+        self._task: Optional[asyncio.Task] = None
+
+    async def _beat(self):
+        await asyncio.sleep(self.delay)
+        deadline = time.monotonic() + self.max_duration
+        while time.monotonic() < deadline:
+            try:
+                await self.bot.send_chat_action(
+                    self.chat_id, self.action, rate_limit_args={"priority": PRIORITY_BACKGROUND}
+                )
+            except TelegramError as e:
+                logger.debug("Chat action not sent: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self) -> "ChatActionHeartbeat":
+        self._task = asyncio.create_task(self._beat(), name="ChatActionHeartbeat")
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def _chat_id(subject: Any) -> Optional[Union[int, str]]:
+    if isinstance(subject, Update):
+        return subject.effective_chat.id if subject.effective_chat else None
+    if isinstance(subject, Job):
+        return subject.payload.get("chat_id")
+    return None
+
+
+def sends_chat_action(action: str) -> Callable:
+    """Decorator for bot methods whose first argument is an Update or a Job: keep ``action``
+    showing in that chat while the method runs. The bot is taken from ``self.app.bot``."""
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(self, subject, *args, **kwargs):
+            chat_id = _chat_id(subject)
+            if chat_id is None:
+                return await fn(self, subject, *args, **kwargs)
+            async with ChatActionHeartbeat(self.app.bot, chat_id, action):
+                return await fn(self, subject, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ProgressiveReply:
+    """A reply that is posted once and then edited as a slow answer takes shape.
+
+    Edits count against the chat's send budget, so intermediate texts are applied at most
+    every ``interval`` (PROGRESS_EDIT_INTERVAL) seconds and only when they changed; ``finish``
+    always applies. Pass ``message_id`` to take over a message that was already posted.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: Union[int, str],
+        reply_to_message_id: Optional[int] = None,
+        message_id: Optional[int] = None,
+        text: str = "",
+        priority: int = PRIORITY_INTERACTIVE,
+        interval: Optional[float] = None,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.reply_to_message_id = reply_to_message_id
+        self.message_id = message_id
+        self.text = text
+        self.priority = priority
+        self.interval = interval if interval is not None else float(os.getenv('PROGRESS_EDIT_INTERVAL', 3))
+        self._last_edit = 0.0
+
+    async def _show(self, text: str, **kwargs):
+        rate_limit_args = {"priority": self.priority}
+        if self.message_id is None:
+            reply_parameters = None
+            if self.reply_to_message_id:
+                reply_parameters = ReplyParameters(self.reply_to_message_id, allow_sending_without_reply=True)
+            message = await self.bot.send_message(
+                self.chat_id, text, reply_parameters=reply_parameters, rate_limit_args=rate_limit_args, **kwargs
+            )
+            self.message_id = message.message_id
+        else:
+            await self.bot.edit_message_text(
+                text, chat_id=self.chat_id, message_id=self.message_id, rate_limit_args=rate_limit_args, **kwargs
+            )
+
+    async def update(self, text: str, force: bool = False, **kwargs):
+        if text == self.text or (not force and time.monotonic() - self._last_edit < self.interval):
+            return
+        self._last_edit, self.text = time.monotonic(), text
+        try:
+            await self._show(text, **kwargs)
+            return
+        except BadRequest as e:
+            if "parse_mode" not in kwargs:
+                logger.warning("⚠️ Could not update progressive reply: %s", e)
+                return
+            # Markdown the backend produced that Telegram can't parse: show it as plain text
+            logger.warning("⚠️ Reply is not valid Markdown, sending it as plain text: %s", e)
+        kwargs.pop("parse_mode")
+        try:
+            await self._show(text, **kwargs)
+        except BadRequest as e:
+            logger.warning("⚠️ Could not update progressive reply: %s", e)
+
+    async def finish(self, text: str, **kwargs):
+        """Show the final text, regardless of when the last edit was"""
+        await self.update(text, force=True, **kwargs)
@@ -0,0 +1,201 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+from aiohttp import web
+from telegram.ext import Application
+
+from backend_client import BackendClient
+from metrics import EVENT_LOOP_LAG
+from startup import PROFILE
+from update_processor import PerUserUpdateProcessor
+from workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag: how late a periodic sleep wakes up compared to when it should"""
+
+    def __init__(self, interval: float = 0.5, window: int = 10):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self.last_tick = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def lag(self) -> float:
+        """Worst lag over the recent window, in seconds"""
+        return max(self.samples, default=0.0)
+
+    @property
+    def stalled_for(self) -> float:
+        """Seconds since the monitor last ran; large values mean the loop is blocked right now"""
+        return max(0.0, time.monotonic() - self.last_tick - self.interval)
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.samples.append(lag)
+            self.last_tick = now
+            EVENT_LOOP_LAG.set(lag)
+
+    def start(self):
+        if self._task is None:
+            self.last_tick = time.monotonic()
+            self._task = asyncio.create_task(self._run(), name="LoopLagMonitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class HealthChecker:
+    """Liveness and readiness probes for the bot process.
+
+    Liveness fails only for conditions a restart fixes: the application or the poller has
+    stopped, or the event loop has been blocked for HEALTH_LIVE_MAX_LOOP_LAG seconds.
+    Readiness additionally fails while the instance is saturated (loop lag or update backlog
+    above their thresholds, updates queued but none finishing) or the backend is unreachable.
+    """
+
+    def __init__(
+        self,
+        app: Application,
+        processor: PerUserUpdateProcessor,
+        backend: BackendClient,
+        bot_mode: str,
+        worker_pool: Optional[WorkerPool] = None,
+    ):
+        self.app = app
+        self.worker_pool = worker_pool
+        self.processor = processor
+        self.backend = backend
+        self.bot_mode = bot_mode
+
+        self.probe_interval = float(os.getenv('HEALTH_PROBE_INTERVAL', 15))
+        self.live_max_loop_lag = float(os.getenv('HEALTH_LIVE_MAX_LOOP_LAG', 10))
+        self.ready_max_loop_lag = float(os.getenv('HEALTH_READY_MAX_LOOP_LAG', 0.5))
+        self.ready_max_queue_depth = int(os.getenv('HEALTH_READY_MAX_QUEUE_DEPTH', processor.max_running_updates * 2))
+        self.ready_max_stall = float(os.getenv('HEALTH_READY_MAX_STALL_SECONDS', 60))
+
+        self.loop_lag = LoopLagMonitor(interval=float(os.getenv('HEALTH_LOOP_LAG_INTERVAL', 0.5)))
+        self.ingestion_started = False  # Set once polling/webhook delivery has been started
+        self.draining = False  # Set on shutdown so the load balancer stops sending traffic
+        self.backend_reachable: Optional[bool] = None
+        self.backend_checked_at = 0.0
+        self.webhook_info: Dict[str, Any] = {}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.loop_lag.start()
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop(), name="HealthChecker:probe")
+
+    async def stop(self):
+        await self.loop_lag.stop()
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    async def _probe_loop(self):
+        """Check dependencies in the background so probe requests never wait on the network"""
+        while True:
+            self.backend_reachable = await self.backend.probe()
+            self.backend_checked_at = time.monotonic()
+            if self.bot_mode == "webhook" and self.ingestion_started:
+                try:
+                    info = await self.app.bot.get_webhook_info()
+                    self.webhook_info = {
+                        "pending_update_count": info.pending_update_count,
+                        "last_error_message": info.last_error_message,
+                    }
+                except Exception as e:
+                    logger.warning("⚠️ getWebhookInfo failed: %s", e)
+            await asyncio.sleep(self.probe_interval)
+
+    def _ingesting(self) -> bool:
+        if self.bot_mode == "webhook":
+            return self.ingestion_started
+        return bool(self.app.updater and self.app.updater.running)
+
+    def report(self) -> Dict[str, Any]:
+        last = self.processor.last_processed_at
+        return {
+            "mode": self.bot_mode,
+            "application_running": self.app.running,
+            "ingestion_running": self._ingesting(),
+            "seconds_since_last_update": round(time.monotonic() - last, 1) if last else None,
+            "update_queue_depth": self.app.update_queue.qsize(),
+            "updates_in_processor": self.processor.current_concurrent_updates,
+            "loop_lag_ms": round(self.loop_lag.lag * 1000, 1),
+            "loop_stalled_ms": round(self.loop_lag.stalled_for * 1000, 1),
+            "backend": {
+                "reachable": self.backend_reachable,
+                "checked_seconds_ago": round(time.monotonic() - self.backend_checked_at, 1)
+                if self.backend_checked_at else None,
+                "circuits": self.backend.circuit_states(),
+            },
+            "startup": PROFILE.report(),
+            **({"webhook": self.webhook_info} if self.webhook_info else {}),
+            **({"workers": self.worker_pool.status()} if self.worker_pool else {}),
+        }
+
+    def liveness(self) -> Tuple[bool, Dict[str, Any]]:
+        report = self.report()
+        failures = []
+        if not report["application_running"]:
+            failures.append("application stopped")
+        if self.ingestion_started and not self.draining and not report["ingestion_running"]:
+            failures.append("update ingestion stopped")
+        if max(self.loop_lag.lag, self.loop_lag.stalled_for) > self.live_max_loop_lag:
+            failures.append("event loop blocked")
+        if self.worker_pool and self.worker_pool.dead_workers():
+            failures.append(f"worker processes exited: {self.worker_pool.dead_workers()}")
+        report["failures"] = failures
+        return not failures, report
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        alive, report = self.liveness()
+        failures = report["failures"]
+        if not self.ingestion_started:
+            failures.append("not started")
+        if self.draining:
+            failures.append("shutting down")
+        if report["loop_lag_ms"] > self.ready_max_loop_lag * 1000:
+            failures.append("event loop lagging")
+        backlog = report["update_queue_depth"] + max(
+            0, report["updates_in_processor"] - self.processor.max_running_updates
+        )
+        if backlog > self.ready_max_queue_depth:
+            failures.append("update backlog too deep")
+        if any((worker["queued_updates"] or 0) > self.ready_max_queue_depth for worker in report.get("workers", [])):
+            failures.append("worker backlog too deep")
+        since_last = report["seconds_since_last_update"]
+        if backlog and since_last is not None and since_last > self.ready_max_stall:
+            failures.append("updates queued but none completing")
+        if self.backend_reachable is False:
+            failures.append("backend unreachable")
+        return not failures, report
+
+    async def live(self, request: web.Request) -> web.Response:
+        ok, report = self.liveness()
+        return web.json_response({"status": "ok" if ok else "failing", **report}, status=200 if ok else 503)
+
+    async def ready(self, request: web.Request) -> web.Response:
+        ok, report = self.readiness()
+        return web.json_response({"status": "ready" if ok else "not_ready", **report}, status=200 if ok else 503)
@@ -0,0 +1,183 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from bot_logging import bind, hash_user, log_context
+from state_store import BaseStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """The job queue, or the user's share of it, is full"""
+
+
+class Job:
+    """A unit of background work; ``payload`` must be JSON-serializable so the job can be persisted"""
+
+    __slots__ = ("id", "kind", "user_id", "payload", "key", "attempts")
+
+    def __init__(self, id: str, kind: str, user_id: str, payload: Dict[str, Any],
+                 key: Optional[str] = None, attempts: int = 0):
+        self.id = id
+        self.kind = kind
+        self.user_id = user_id
+        self.payload = payload
+        self.key = key
+        self.attempts = attempts
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        return cls(**data)
+
+
+JobHandler = Callable[[Job], Awaitable[None]]
+
+
+class JobQueue:
+    """Bounded queue of long-running media jobs, processed by JOB_WORKERS worker tasks.
+
+    Users take turns: each worker picks the next job of the user who has waited longest,
+    and a user has at most JOB_MAX_RUNNING_PER_USER jobs running, so one user with 50
+    uploads cannot starve the others. Jobs are written to ``store`` when submitted and
+    removed once handled; jobs still stored at startup (the process stopped mid-job) are
+    queued again, so a job may run more than once and gives up after JOB_MAX_ATTEMPTS.
+    """
+
+    NAMESPACE = "jobs"
+
+    def __init__(self, store: BaseStateStore, handlers: Dict[str, JobHandler]):
+        self.store = store
+        self.handlers = handlers
+        self.worker_count = int(os.getenv('JOB_WORKERS', 4))
+        self.max_jobs = int(os.getenv('JOB_QUEUE_MAX', 1000))
+        self.max_jobs_per_user = int(os.getenv('JOB_QUEUE_MAX_PER_USER', 50))
+        self.max_running_per_user = int(os.getenv('JOB_MAX_RUNNING_PER_USER', 1))
+        self.max_attempts = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+        self.job_ttl = float(os.getenv('JOB_TTL', 24 * 3600))
+
+        # user -> that user's queued jobs; the first user in the dict is next in turn
+        self._queues: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+        self._running: Dict[str, int] = {}
+        self._keys: Set[str] = set()  # Keys of queued and running jobs
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def queued(self) -> int:
+        return sum(len(jobs) for jobs in self._queues.values())
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def active(self, key: str) -> bool:
+        """Whether a job submitted with ``key`` is queued or running"""
+        return key in self._keys
+
+    def _enqueue(self, job: Job):
+        self._queues.setdefault(job.user_id, deque()).append(job)
+        if job.key:
+            self._keys.add(job.key)
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def submit(self, kind: str, user_id: str, payload: Dict[str, Any], key: Optional[str] = None) -> int:
+        """Queue a job and return how many of the user's jobs are ahead of it.
+
+        Raises QueueFull when JOB_QUEUE_MAX jobs are queued, or JOB_QUEUE_MAX_PER_USER for this user.
+        """
+        user_jobs = self._queues.get(user_id, ())
+        if self.queued >= self.max_jobs or len(user_jobs) >= self.max_jobs_per_user:
+            raise QueueFull()
+        ahead = len(user_jobs) + self._running.get(user_id, 0)
+        # Ids sort in submission order, which is the order persisted jobs are restored in
+        job = Job(f"{time.time_ns():020d}-{next(self._sequence):06d}", kind, user_id, payload, key)
+        await self.store.set(self.NAMESPACE, job.id, job.to_dict(), ttl=self.job_ttl)
+        self._enqueue(job)
+        return ahead
+
+    def _take(self) -> Optional[Job]:
+        for user_id, jobs in self._queues.items():
+            if self._running.get(user_id, 0) < self.max_running_per_user:
+                job = jobs.popleft()
+                # The user goes to the back of the line, or leaves it if nothing else is queued
+                del self._queues[user_id]
+                if jobs:
+                    self._queues[user_id] = jobs
+                self._running[user_id] = self._running.get(user_id, 0) + 1
+                return job
+        return None
+
+    def _release(self, job: Job):
+        remaining = self._running.pop(job.user_id) - 1
+        if remaining:
+            self._running[job.user_id] = remaining
+        if job.key:
+            self._keys.discard(job.key)
+        self._wakeup.set()
+        if not self._queues and not self._running:
+            self._idle.set()
+
+    async def _work(self):
+        while True:
+            job = self._take()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            job.attempts += 1
+            token = bind(job=job.kind, user=hash_user(job.user_id))
+            try:
+                # Counted before running, so a job that keeps crashing the process is dropped eventually
+                await self.store.set(self.NAMESPACE, job.id, job.to_dict(), ttl=self.job_ttl)
+                await self.handlers[job.kind](job)
+            except asyncio.CancelledError:
+                # Stopping: the job stays stored and runs again after the restart
+                self._release(job)
+                raise
+            except Exception:
+                logger.exception("❌ Background job failed", extra={"attempt": job.attempts})
+            finally:
+                log_context.reset(token)
+            try:
+                await self.store.delete(self.NAMESPACE, job.id)
+            finally:
+                self._release(job)
+
+    async def start(self):
+        """Restore persisted jobs and start the workers"""
+        for job_id, data in sorted((await self.store.items(self.NAMESPACE)).items()):
+            job = Job.from_dict(data)
+            if job.attempts >= self.max_attempts:
+                logger.warning("🗑️ Dropping job that failed too often", extra={"job": job.kind, "attempts": job.attempts})
+                await self.store.delete(self.NAMESPACE, job_id)
+                continue
+            self._enqueue(job)
+        if self.queued:
+            logger.info("📥 Restored background jobs", extra={"jobs": self.queued})
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"JobQueue:worker-{index}") for index in range(self.worker_count)
+        ]
+
+    async def join(self):
+        """Wait until no job is queued or running"""
+        await self._idle.wait()
+
+    async def stop(self):
+        """Cancel the workers; unfinished jobs stay persisted for the next start"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
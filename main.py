@@ -0,0 +1,30 @@
+"""Container entry point: binds the HTTP port before importing the Telegram stack.
+
+``python bot_handler.py`` still works, but pays for every import before anything listens.
+"""
+import asyncio
+
+from startup import PROFILE, EarlyServer
+
+
+async def main():
+    server = EarlyServer()
+    with PROFILE.phase("bind_port"):
+        await server.start()
+    with PROFILE.phase("import_bot"):
+        from bot_handler import AgnoTelegramBot
+    try:
+        bot = AgnoTelegramBot()
+    except Exception:
+        await server.cleanup()
+        raise
+    await bot.run(server)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from bot_logging import configure_logging
+
+    load_dotenv()  # PORT and LOG_* may come from .env, and are needed before bot_handler loads it
+    configure_logging()
+    asyncio.run(main())
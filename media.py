@@ -0,0 +1,52 @@
+import os
+import aiohttp
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Union
+from telegram import File
+
+from backend_client import BackendClient
+from metrics import MEDIA_BYTES
+
+
+class MediaStreamer:
+    """Moves Telegram media to the backend without touching the local disk.
+
+    Small files are pulled into memory in one request; larger ones are streamed chunk by chunk
+    from Telegram's file endpoint straight into the multipart body of the backend upload.
+    """
+
+    def __init__(self, backend: BackendClient):
+        self.backend = backend
+        self.inline_max_bytes = int(os.getenv('MEDIA_INLINE_MAX_BYTES', 1024 * 1024))
+        self.chunk_size = int(os.getenv('MEDIA_STREAM_CHUNK_BYTES', 64 * 1024))
+        self.download_timeout = float(os.getenv('MEDIA_DOWNLOAD_TIMEOUT', 120))
+
+    @staticmethod
+    def _is_remote(file: File) -> bool:
+        # Files served by a local Bot API server come back as filesystem paths
+        return bool(file.file_path) and file.file_path.startswith(("http://", "https://"))
+
+    async def _iter_body(self, response: aiohttp.ClientResponse, kind: str) -> AsyncIterator[bytes]:
+        transferred = MEDIA_BYTES.labels(kind)
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            transferred.inc(len(chunk))
+            yield chunk
+
+    @asynccontextmanager
+    async def open(self, file: File, kind: str = "file") -> AsyncIterator[Union[bytes, AsyncIterator[bytes]]]:
+        """Yield a multipart-ready payload for ``file``: bytes if small, else a chunk stream.
+
+        ``kind`` (receipt, statement, audio, ...) labels the transferred bytes in the metrics.
+        """
+        if not self._is_remote(file) or (file.file_size and file.file_size <= self.inline_max_bytes):
+            payload = bytes(await file.download_as_bytearray())
+            MEDIA_BYTES.labels(kind).inc(len(payload))
+            yield payload
+            return
+
+        async with self.backend.session.get(
+            file.file_path,
+            timeout=aiohttp.ClientTimeout(total=self.download_timeout),
+        ) as response:
+            response.raise_for_status()
+            yield self._iter_body(response, kind)
@@ -1,3 +1,8 @@
+import string
+import functools
+from typing import Any, Dict, Optional, Tuple
+from telegram.helpers import escape_markdown
+
 MESSAGES = {
     "en": {
         "welcome_authenticated": (
@@ -5,6 +10,15 @@ MESSAGES = {
             "How can I help you today? You can track expenses, manage reminders, and view summaries.\n\n"
             "Type /help for examples!"
         ),
+        "welcome_unauthenticated": (
+            "👋 *Welcome to OkanAssist!* Your personal finance assistant.\n\n"
+            "I use AI to help you track your finances effortlessly. Here's what you can do:\n\n"
+            "💸 *Log Transactions:* Just say 'spent $15 on lunch' or 'received $500 salary'.\n"
+            "📸 *Process Documents:* Send me a photo of a receipt or a PDF bank statement.\n"
+            "⏰ *Create Reminders:* Tell me 'remind me to pay the internet bill on Friday'.\n"
+            "📊 *Get Summaries:* Ask for your weekly spending or income reports.\n\n"
+            "To unlock these features, please create your account by typing /register."
+        ),
         "register_start": ("🚀 *Welcome to OkanAssist AI Registration!*\n\n"
             "I need a few details to create your account.\n\n"
             "📧 *Please enter your email address:*\n"
@@ -36,6 +50,7 @@ MESSAGES = {
         
         "invalid_confirmation": "❌ Invalid response. Please type /confirm to create your account or /cancel to start over.",
         "register_cancelled": "❌ Registration cancelled. You can start over anytime by typing /register.",
+        "register_expired": "⌛ Your registration session has expired. Type /register to start again.",
         "payment_success": "✅ Payment successful! You now have premium access. Type /profile to check your status.",
         "payment_failure": "❌ Payment failed or was cancelled. Please try again with /upgrade or contact support if the issue persists.",
         "generic_error": "❌ An error occurred. Please try again later or contact support if the issue persists.",
@@ -48,6 +63,10 @@ MESSAGES = {
             "In the meantime, you can also visit our FAQ page or check out /help for more information."
         ),
         "generic_downtime": "⚠️ The service is currently experiencing issues. Please try again later or contact support if the issue persists.",
+        "statement_uploading": "⏳ Uploading your bank statement... {percent}%",
+        "statement_processing": "⚙️ Statement received, importing transactions. This can take a few minutes...",
+        "job_queued": "📥 Got it! {position} of your earlier files are still being processed, I'll reply to this one right after.",
+        "job_queue_full": "⏳ I'm processing a lot of files right now. Please send this one again in a few minutes.",
         "user_not_found": "🔐 User not found. Please register first by typing /register.\n",
         "profile_info": (
                             "👤 *Your Profile*\n\n"
@@ -118,6 +137,7 @@ MESSAGES = {
         ),
         "invalid_confirmation": "❌ Respuesta inválida. Por favor escribe /confirm para crear tu cuenta o /cancel para empezar de nuevo.",
         "register_cancelled": "❌ Registro cancelado. Puedes empezar de nuevo en cualquier momento escribiendo /register.",
+        "register_expired": "⌛ Tu sesión de registro ha expirado. Escribe /register para empezar de nuevo.",
         "payment_success": "✅ ¡Pago exitoso! Ahora tienes acceso premium. Escribe /profile para ver tu estado.",
         "payment_failure": "❌ El pago falló o fue cancelado. Por favor intenta de nuevo con /upgrade o contacta soporte si el problema persiste.",
         "generic_error": "❌ Ocurrió un error. Por favor intenta más tarde o contacta soporte si el problema persiste.",
@@ -130,6 +150,10 @@ MESSAGES = {
             "Mientras tanto, puedes visitar nuestra página de preguntas frecuentes o consultar /help para más información."
         ),
         "generic_downtime": "⚠️ El servicio está experimentando problemas. Por favor intenta más tarde o contacta soporte si el problema persiste.",
+        "statement_uploading": "⏳ Subiendo tu estado de cuenta... {percent}%",
+        "statement_processing": "⚙️ Estado de cuenta recibido, importando transacciones. Esto puede tardar unos minutos...",
+        "job_queued": "📥 ¡Recibido! Aún estoy procesando {position} de tus archivos anteriores, responderé a este justo después.",
+        "job_queue_full": "⏳ Estoy procesando muchos archivos en este momento. Por favor envía este de nuevo en unos minutos.",
         "user_not_found": "🔐 Usuario no encontrado. Por favor regístrate primero escribiendo /register.\n",
         "profile_info": (
                             "👤 *Tu Perfil*\n\n"
@@ -201,6 +225,7 @@ MESSAGES = {
         ),
         "invalid_confirmation": "❌ Resposta inválida. Por favor, digite /confirm para criar sua conta ou /cancel para começar novamente.",
         "register_cancelled": "❌ Registro cancelado. Você pode começar novamente a qualquer momento digitando /register.",
+        "register_expired": "⌛ Sua sessão de registro expirou. Digite /register para começar novamente.",
         "payment_success": "✅ Pagamento realizado com sucesso! Agora você tem acesso premium. Digite /profile para ver seu status.",
         "payment_failure": "❌ O pagamento falhou ou foi cancelado. Por favor, tente novamente com /upgrade ou entre em contato com o suporte se o problema persistir.",
         "generic_error": "❌ Ocorreu um erro. Por favor, tente novamente mais tarde ou entre em contato com o suporte se o problema persistir.",
@@ -213,6 +238,10 @@ MESSAGES = {
             "Enquanto isso, você pode visitar nossa página de FAQ ou consultar /help para mais informações."
         ),
         "generic_downtime": "⚠️ O serviço está enfrentando problemas. Por favor, tente novamente mais tarde ou entre em contato com o suporte se o problema persistir.",
+        "statement_uploading": "⏳ Enviando seu extrato bancário... {percent}%",
+        "statement_processing": "⚙️ Extrato recebido, importando transações. Isso pode levar alguns minutos...",
+        "job_queued": "📥 Recebido! Ainda estou processando {position} dos seus arquivos anteriores, responderei a este logo em seguida.",
+        "job_queue_full": "⏳ Estou processando muitos arquivos agora. Por favor, envie este novamente em alguns minutos.",
         "user_not_found": "🔐 Usuário não encontrado. Por favor, registre-se primeiro digitando /register.\n",
         "profile_info": (
                             "👤 *Seu Perfil*\n\n"
@@ -241,12 +270,95 @@ MESSAGES = {
 }
 
 
-def get_message(key: str, lang: str, **kwargs) -> str:
-    """Gets a translated message, falling back to English."""
-    lang_short = lang.split('-')[0] if lang else 'en'
-    
-    # Fallback to 'en' if language or key is not found
-    messages = MESSAGES.get(lang_short, MESSAGES['en'])
-    message_template = messages.get(key, MESSAGES['en'].get(key, "Message key not found."))
-    
-    return message_template.format(**kwargs)
\ No newline at end of file
+_FORMATTER = string.Formatter()
+_ESCAPE_VERSIONS = {"Markdown": 1, "MarkdownV2": 2}
+DEFAULT_LANGUAGE = "en"
+
+
+@functools.lru_cache(maxsize=4096)
+def _escape(value: str, version: int) -> str:
+    # Profile fields like currency, timezone and language repeat across users and requests
+    return escape_markdown(value, version=version)
+
+
+class MessageTemplate:
+    """A catalog entry: the template, its placeholders and, for static messages, the rendered text"""
+
+    __slots__ = ("key", "template", "fields", "text")
+
+    def __init__(self, key: str, template: str):
+        self.key = key
+        self.template = template
+        self.fields = frozenset(name for _, name, _, _ in _FORMATTER.parse(template) if name)
+        # Static messages are rendered once; "{{" and "}}" still need format() to collapse
+        self.text: Optional[str] = None if self.fields else template.format()
+
+    def format(self, escape: Optional[str] = None, **kwargs: Any) -> str:
+        """Render with ``kwargs``; ``escape`` ('Markdown' or 'MarkdownV2') escapes the values first"""
+        if self.text is not None:
+            return self.text
+        if escape:
+            version = _ESCAPE_VERSIONS[escape]
+            kwargs = {name: _escape(str(value), version) for name, value in kwargs.items()}
+        return self.template.format(**kwargs)
+
+
+@functools.lru_cache(maxsize=256)
+def normalize_language(lang: Optional[str]) -> str:
+    """Map a Telegram language code ('pt-br', 'es_MX', 'EN', None) to a catalog language"""
+    short = (lang or DEFAULT_LANGUAGE).replace("_", "-").split("-")[0].lower()
+    return short if short in MESSAGES else DEFAULT_LANGUAGE
+
+
+def _validate(messages: Dict[str, Dict[str, Any]]) -> None:
+    """Every locale must define exactly the keys, placeholders and commands of the default locale"""
+    reference = messages[DEFAULT_LANGUAGE]
+    problems = []
+    for lang, catalog in messages.items():
+        missing = reference.keys() - catalog.keys()
+        extra = catalog.keys() - reference.keys()
+        if missing:
+            problems.append(f"{lang}: missing keys {sorted(missing)}")
+        if extra:
+            problems.append(f"{lang}: keys not in '{DEFAULT_LANGUAGE}' {sorted(extra)}")
+        for key in reference.keys() & catalog.keys():
+            expected, actual = reference[key], catalog[key]
+            if isinstance(expected, str):
+                if not isinstance(actual, str):
+                    problems.append(f"{lang}.{key}: expected a string")
+                    continue
+                expected_fields = {name for _, name, _, _ in _FORMATTER.parse(expected) if name}
+                actual_fields = {name for _, name, _, _ in _FORMATTER.parse(actual) if name}
+                if expected_fields != actual_fields:
+                    problems.append(f"{lang}.{key}: placeholders {sorted(actual_fields)}, expected {sorted(expected_fields)}")
+            elif isinstance(expected, dict) and (not isinstance(actual, dict) or expected.keys() != actual.keys()):
+                problems.append(f"{lang}.{key}: entries differ from '{DEFAULT_LANGUAGE}'")
+    if problems:
+        raise ValueError("Invalid message catalog:\n  " + "\n  ".join(problems))
+
+
+def _compile(messages: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str], MessageTemplate]:
+    _validate(messages)
+    return {
+        (lang, key): MessageTemplate(key, template)
+        for lang, catalog in messages.items()
+        for key, template in catalog.items()
+        if isinstance(template, str)
+    }
+
+
+# (language, key) -> MessageTemplate, built and validated once at import
+CATALOG = _compile(MESSAGES)
+
+
+def get_template(key: str, lang: Optional[str]) -> MessageTemplate:
+    """O(1) lookup; raises KeyError for keys that don't exist in the catalog"""
+    return CATALOG[(normalize_language(lang), key)]
+
+
+def get_message(key: str, lang: Optional[str], escape: Optional[str] = None, **kwargs) -> str:
+    """Gets a translated message, falling back to English for unknown languages.
+
+    ``escape='Markdown'`` or ``'MarkdownV2'`` escapes the values substituted into the template.
+    """
+    return get_template(key, lang).format(escape, **kwargs)
@@ -0,0 +1,129 @@
+import time
+import logging
+import functools
+from typing import Any, Callable, Dict, Optional
+from aiohttp import web
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, disable_created_metrics, generate_latest
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from bot_logging import bind, log_context
+
+logger = logging.getLogger(__name__)
+
+# *_created series double the output and collide when worker metrics are merged
+disable_created_metrics()
+
+# Handlers range from cached /help replies to multi-minute bank statement imports
+HANDLER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+BACKEND_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Time spent in each update handler", ["handler"], buckets=HANDLER_BUCKETS
+)
+HANDLER_IN_FLIGHT = Gauge("bot_handler_in_flight", "Handler calls currently running", ["handler"])
+HANDLER_EXCEPTIONS = Counter(
+    "bot_handler_exceptions_total", "Exceptions that escaped an update handler", ["handler"]
+)
+
+BACKEND_LATENCY = Histogram(
+    "bot_backend_request_duration_seconds", "Backend request time, including reading the response",
+    ["endpoint"], buckets=BACKEND_BUCKETS,
+)
+BACKEND_IN_FLIGHT = Gauge("bot_backend_requests_in_flight", "Backend requests currently open", ["endpoint"])
+BACKEND_ERRORS = Counter(
+    "bot_backend_errors_total",
+    "Failed backend calls by reason: 401, 4xx, 5xx, timeout, connection or circuit_open",
+    ["endpoint", "reason"],
+)
+
+TELEGRAM_ERRORS = Counter(
+    "bot_telegram_errors_total",
+    "Failed Bot API calls by reason: 429, 400, 401, 403, timeout, network or other",
+    ["endpoint", "reason"],
+)
+
+MEDIA_BYTES = Counter("bot_media_bytes_total", "Media bytes moved from Telegram to the backend", ["kind"])
+
+UPDATE_QUEUE_DEPTH = Gauge("bot_update_queue_depth", "Updates received but not yet dispatched")
+UPDATES_IN_PROCESSOR = Gauge(
+    "bot_updates_in_processor", "Updates dispatched and running or waiting for a handler slot"
+)
+UPDATES_SKIPPED = Counter(
+    "bot_updates_skipped_total", "Updates not handled, by reason: duplicate or coalesced", ["reason"]
+)
+SEND_QUEUE_DEPTH = Gauge("bot_telegram_send_queue_depth", "Outgoing Bot API calls waiting for a send token")
+JOBS_QUEUED = Gauge("bot_jobs_queued", "Background media jobs waiting for a job worker")
+JOBS_RUNNING = Gauge("bot_jobs_running", "Background media jobs being processed")
+EVENT_LOOP_LAG = Gauge("bot_event_loop_lag_seconds", "How late the last periodic event-loop wakeup was")
+
+
+def backend_error_reason(status: int) -> Optional[str]:
+    """Label for a backend HTTP status, or None if it is not an error"""
+    if status == 401:
+        return "401"
+    if 400 <= status < 500:
+        return "4xx"
+    if status >= 500:
+        return "5xx"
+    return None
+
+
+def track_handler(fn: Callable) -> Callable:
+    """Record latency, concurrency and escaped exceptions of an async update handler,
+    and tag log records emitted inside it with the handler name"""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        in_flight = HANDLER_IN_FLIGHT.labels(name)
+        in_flight.inc()
+        token = bind(handler=name)
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            HANDLER_EXCEPTIONS.labels(name).inc()
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            HANDLER_LATENCY.labels(name).observe(duration)
+            in_flight.dec()
+            logger.info("Update handled", extra={"duration_ms": round(duration * 1000, 1)})
+            log_context.reset(token)
+
+    return wrapper
+
+
+class CacheCollector:
+    """Exposes hit/miss counters and sizes of the bot's in-memory caches at scrape time"""
+
+    def __init__(self):
+        self.caches: Dict[str, Any] = {}
+
+    def track(self, name: str, cache: Any):
+        """``cache`` needs ``hits`` and ``misses`` attributes; ``len()`` is reported if supported"""
+        self.caches[name] = cache
+
+    def collect(self):
+        hits = CounterMetricFamily("bot_cache_hits", "Cache lookups answered from the cache", labels=["cache"])
+        misses = CounterMetricFamily("bot_cache_misses", "Cache lookups that missed", labels=["cache"])
+        entries = GaugeMetricFamily("bot_cache_entries", "Entries currently held in the cache", labels=["cache"])
+        for name, cache in self.caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            if hasattr(cache, "__len__"):
+                entries.add_metric([name], len(cache))
+        yield hits
+        yield misses
+        yield entries
+
+
+CACHES = CacheCollector()
+REGISTRY.register(CACHES)
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Prometheus scrape endpoint"""
+    return web.Response(body=generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+from typing import Any, Callable, Coroutine, Dict, Optional, Union
+from telegram.error import BadRequest, Forbidden, InvalidToken, NetworkError, RetryAfter, TelegramError, TimedOut
+from telegram.ext import BaseRateLimiter
+from metrics import TELEGRAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Lower value = sent first when the global budget is the bottleneck
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Requests that don't count against a chat's message budget
+CHAT_EXEMPT_ENDPOINTS = {"sendChatAction", "getChat", "getChatMember"}
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, holding at most ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # Set when Telegram answers with RetryAfter
+        self.lock = asyncio.Lock()  # Keeps sends to one chat in FIFO order
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        return not self.lock.locked() and self.wait_time() == 0 and self.tokens >= self.capacity
+
+
+class SendScheduler(BaseRateLimiter[Dict[str, Any]]):
+    """Shapes outgoing Bot API traffic to Telegram's limits.
+
+    * a per-chat bucket (about 1 msg/s in private chats, 20 msg/min in groups),
+    * a global bucket (about 30 msg/s) granted strictly in priority order,
+    * RetryAfter is honored by pausing the affected chat (or everything) and retrying.
+
+    Pass ``rate_limit_args={"priority": PRIORITY_BACKGROUND}`` on bot calls that can wait,
+    such as support forwards; everything else is treated as an interactive reply.
+    """
+
+    def __init__(self):
+        self.overall_rate = float(os.getenv('TELEGRAM_OVERALL_RATE', 30))
+        self.chat_rate = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+        self.chat_burst = float(os.getenv('TELEGRAM_CHAT_BURST', 3))
+        self.group_per_minute = float(os.getenv('TELEGRAM_GROUP_PER_MINUTE', 20))
+        self.group_burst = float(os.getenv('TELEGRAM_GROUP_BURST', 5))
+        self.max_retries = int(os.getenv('TELEGRAM_MAX_RETRIES', 5))
+        self.max_chat_buckets = 10000
+
+        self._global = TokenBucket(self.overall_rate, self.overall_rate)
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight = 0  # Calls between process_request entry and completion
+
+    async def initialize(self) -> None:
+        # Called once for the application's bot and again through the updater
+        if self._dispatcher is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._dispatcher = asyncio.create_task(self._dispatch(), name="SendScheduler:dispatch")
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    @property
+    def pending(self) -> int:
+        """Sends waiting for a global token"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no call is queued or being sent; False if ``timeout`` ran out first"""
+        deadline = time.monotonic() + timeout
+        while self._in_flight:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def _dispatch(self):
+        """Hand out global tokens to queued sends, highest priority first"""
+        while True:
+            _, _, waiter = await self._queue.get()
+            if waiter.done():  # The sender was cancelled while queued
+                continue
+            while (wait := self._global.wait_time()) > 0:
+                await asyncio.sleep(wait)
+            self._global.consume()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chat_buckets:
+                for key in [k for k, b in self._chats.items() if b.idle]:
+                    del self._chats[key]
+            if self._is_group(chat_id):
+                bucket = TokenBucket(self.group_per_minute / 60, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    @staticmethod
+    def _is_group(chat_id: Union[int, str]) -> bool:
+        try:
+            return int(chat_id) < 0
+        except (TypeError, ValueError):
+            return True  # @channel usernames
+
+    @staticmethod
+    def _error_reason(error: TelegramError) -> str:
+        # TimedOut and BadRequest are NetworkError subclasses, so they are checked first
+        if isinstance(error, TimedOut):
+            return "timeout"
+        if isinstance(error, BadRequest):
+            return "400"
+        if isinstance(error, Forbidden):
+            return "403"
+        if isinstance(error, InvalidToken):
+            return "401"
+        if isinstance(error, NetworkError):
+            return "network"
+        return "other"
+
+    async def _acquire(self, chat_id: Optional[Union[int, str]], endpoint: str, priority: int):
+        if chat_id is None:
+            # Not a chat message (getMe, getFile, getUpdates, ...): only respect a global pause
+            while (wait := self._global.blocked_until - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+            return
+
+        if endpoint not in CHAT_EXEMPT_ENDPOINTS:
+            bucket = self._chat_bucket(chat_id)
+            async with bucket.lock:
+                while (wait := bucket.wait_time()) > 0:
+                    await asyncio.sleep(wait)
+                bucket.consume()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((priority, next(self._sequence), waiter))
+        await waiter
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Any:
+        chat_id = data.get("chat_id")
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_INTERACTIVE)
+
+        self._in_flight += 1
+        try:
+            return await self._send(callback, args, kwargs, endpoint, chat_id, priority)
+        finally:
+            self._in_flight -= 1
+
+    async def _send(self, callback, args, kwargs, endpoint: str, chat_id, priority: int) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, endpoint, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                TELEGRAM_ERRORS.labels(endpoint, "429").inc()
+                if attempt == self.max_retries:
+                    logger.error(
+                        "❌ Telegram rate limit still hit after %d retries", self.max_retries,
+                        extra={"endpoint": endpoint},
+                    )
+                    raise
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                logger.warning("⏳ Telegram asked to retry in %.1fs", delay, extra={"endpoint": endpoint})
+                if chat_id is None:
+                    self._global.block(delay)
+                else:
+                    self._chat_bucket(chat_id).block(delay)
+            except TelegramError as e:
+                TELEGRAM_ERRORS.labels(endpoint, self._error_reason(e)).inc()
+                raise
@@ -0,0 +1,154 @@
+import os
+import time
+import random
+import logging
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend endpoint whose circuit is open"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit for '{endpoint}' is open, retry in {retry_in:.0f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Per-endpoint circuit breaker driven by error rate and slow-call rate.
+
+    closed     -> calls pass; outcomes are tracked over a rolling time window
+    open       -> calls fail fast with CircuitOpenError for ``open_seconds``
+    half_open  -> up to ``half_open_probes`` calls test the backend; a success closes the
+                  circuit again, a failure re-opens it
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.window_seconds = float(os.getenv('CIRCUIT_WINDOW_SECONDS', 60))
+        self.min_calls = int(os.getenv('CIRCUIT_MIN_CALLS', 10))
+        self.error_rate_threshold = float(os.getenv('CIRCUIT_ERROR_RATE', 0.5))
+        self.slow_call_seconds = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', 10))
+        self.slow_rate_threshold = float(os.getenv('CIRCUIT_SLOW_RATE', 0.8))
+        self.open_seconds = float(os.getenv('CIRCUIT_OPEN_SECONDS', 30))
+        self.half_open_probes = int(os.getenv('CIRCUIT_HALF_OPEN_PROBES', 1))
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._calls: deque = deque()  # (timestamp, failed, slow)
+        self._probes_in_flight = 0
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not go through"""
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            retry_in = self.opened_at + self.open_seconds - now
+            if retry_in > 0:
+                raise CircuitOpenError(self.name, retry_in)
+            self.state = self.HALF_OPEN
+            logger.warning("🟡 Circuit is half-open, probing backend", extra={"endpoint": self.name})
+        if self.state == self.HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                raise CircuitOpenError(self.name, 0)
+            self._probes_in_flight += 1
+
+    def record(self, ok: bool, latency: float):
+        """Record the outcome of a call that passed before_call()"""
+        now = time.monotonic()
+        slow = latency >= self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if ok and not slow:
+                self._close()
+            else:
+                self._open(now)
+            return
+
+        self._calls.append((now, not ok, slow))
+        self._trim(now)
+        total = len(self._calls)
+        if total < self.min_calls:
+            return
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        slow_calls = sum(1 for _, _, is_slow in self._calls if is_slow)
+        if failures / total >= self.error_rate_threshold or slow_calls / total >= self.slow_rate_threshold:
+            self._open(now)
+
+    def abandon(self):
+        """The call ended without an outcome (e.g. it was cancelled); free its probe slot"""
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _open(self, now: float):
+        if self.state != self.OPEN:
+            logger.error("🔴 Circuit opened", extra={"endpoint": self.name})
+        self.state = self.OPEN
+        self.opened_at = now
+        self._probes_in_flight = 0
+
+    def _close(self):
+        logger.warning("🟢 Circuit closed", extra={"endpoint": self.name})
+        self.state = self.CLOSED
+        self._calls.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._trim(now)
+        total = len(self._calls)
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        return {
+            "state": self.state,
+            "calls": total,
+            "error_rate": round(failures / total, 3) if total else 0.0,
+        }
+
+
+class RetryPolicy:
+    """Retry/hedging settings for one idempotent backend endpoint"""
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.05,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number ``attempt + 1``"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Keeps the most recent latencies of an endpoint to estimate its quantiles"""
+
+    def __init__(self, size: int = 256, min_samples: int = 20):
+        self._samples: deque = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, latency: float):
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The q-quantile of recent latencies, or None until enough samples exist"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import logging
+import contextlib
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+class StartupProfile:
+    """Wall-clock time of each startup phase, measured from when this module was imported"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.modules_before = len(sys.modules)
+        self.completed: Optional[float] = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def complete(self):
+        """Mark startup as finished and log the profile once"""
+        if self.completed is not None:
+            return
+        self.completed = time.perf_counter() - self.started
+        logger.info("🚀 Startup complete", extra={"startup": self.report()})
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round(self.completed * 1000, 1) if self.completed is not None else None,
+            "phases_ms": {name: round(duration * 1000, 1) for name, duration in self.phases},
+            "modules_imported": len(sys.modules) - self.modules_before,
+        }
+
+
+PROFILE = StartupProfile()
+
+
+class EarlyServer:
+    """HTTP server that binds the port before the bot stack is imported.
+
+    Routes are attached as components become ready. Until then liveness answers 200
+    (the process is up and booting) and every other path 503, so a load balancer or
+    Telegram's webhook delivery retries instead of getting a 404.
+    """
+
+    LIVENESS_PATHS = {"/health", "/health/live"}
+
+    def __init__(self, port: Optional[int] = None):
+        self.port = port if port is not None else int(os.getenv('PORT', 8080))
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+        self.ready = False  # Set once every route has been attached; unknown paths then get a 404
+        self._runner: Optional[web.AppRunner] = None
+
+    def add_get(self, path: str, handler: Handler):
+        self.routes[("GET", path)] = handler
+
+    def add_post(self, path: str, handler: Handler):
+        self.routes[("POST", path)] = handler
+
+    async def _dispatch(self, request: web.Request) -> web.StreamResponse:
+        handler = self.routes.get((request.method, request.path))
+        if handler is not None:
+            return await handler(request)
+        if self.ready:
+            raise web.HTTPNotFound()
+        if request.path in self.LIVENESS_PATHS:
+            return web.json_response({"status": "starting", "startup": PROFILE.report()})
+        return web.json_response({"status": "starting"}, status=503)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/{path:.*}", self._dispatch)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '0.0.0.0', self.port).start()
+        logger.info("🌐 HTTP server started", extra={"port": self.port})
+
+    async def cleanup(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value: Any) -> str:
+    """Compact JSON: no whitespace, and None fields dropped from dicts"""
+    if isinstance(value, dict):
+        value = {k: v for k, v in value.items() if v is not None}
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+class BaseStateStore(ABC):
+    """Namespaced key/value store for conversation state, with per-entry expiry.
+
+    ``ttl=None`` on :meth:`set` uses the store's ``default_ttl``; a ttl of 0 (or a
+    ``default_ttl`` of None) keeps the entry until it is deleted.
+    """
+
+    def __init__(self, default_ttl: Optional[float] = None):
+        self.default_ttl = default_ttl
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Return the stored value, or None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value, resetting its expiry"""
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str):
+        """Remove a value if present"""
+
+    @abstractmethod
+    async def items(self, namespace: str) -> Dict[str, Any]:
+        """All live entries of a namespace"""
+
+    @abstractmethod
+    async def purge_expired(self) -> int:
+        """Drop expired entries and return how many were removed"""
+
+    async def close(self):
+        """Release resources held by the store"""
+
+
+class MemoryStateStore(BaseStateStore):
+    """Process-local store; bounded by ``max_entries`` with least-recently-used eviction"""
+
+    def __init__(self, default_ttl: Optional[float] = None, max_entries: int = 100000, purge_interval: float = 300):
+        super().__init__(default_ttl)
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+        self._data: "OrderedDict[Tuple[str, str], Tuple[Optional[float], str]]" = OrderedDict()
+
+    def _live(self, entry_key: Tuple[str, str]) -> Optional[str]:
+        entry = self._data.get(entry_key)
+        if entry is None:
+            return None
+        expires_at, encoded = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[entry_key]
+            return None
+        return encoded
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        encoded = self._live((namespace, key))
+        if encoded is None:
+            return None
+        self._data.move_to_end((namespace, key))
+        return json.loads(encoded)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[(namespace, key)] = (self._expires_at(ttl), _encode(value))
+        self._data.move_to_end((namespace, key))
+        if time.monotonic() - self._last_purge > self.purge_interval:
+            await self.purge_expired()
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def delete(self, namespace: str, key: str):
+        self._data.pop((namespace, key), None)
+
+    async def items(self, namespace: str) -> Dict[str, Any]:
+        result = {}
+        for entry_key in [k for k in self._data if k[0] == namespace]:
+            encoded = self._live(entry_key)
+            if encoded is not None:
+                result[entry_key[1]] = json.loads(encoded)
+        return result
+
+    async def purge_expired(self) -> int:
+        self._last_purge = time.monotonic()
+        now = time.time()
+        expired = [k for k, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]
+        for entry_key in expired:
+            del self._data[entry_key]
+        return len(expired)
+
+
+class SQLiteStateStore(BaseStateStore):
+    """File-backed store that survives restarts and can be shared by processes on one host"""
+
+    def __init__(self, path: str, default_ttl: Optional[float] = None, purge_interval: float = 300):
+        super().__init__(default_ttl)
+        import sqlite3  # Only needed when this backend is selected
+
+        self.path = path
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL,"
+            " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+        )
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def _run(self, sql: str, params: tuple = ()) -> list:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        rows = await self._run(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time()),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        await self._run(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, _encode(value), self._expires_at(ttl)),
+        )
+        if time.monotonic() - self._last_purge > self.purge_interval:
+            await self.purge_expired()
+
+    async def delete(self, namespace: str, key: str):
+        await self._run("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def items(self, namespace: str) -> Dict[str, Any]:
+        rows = await self._run(
+            "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time()),
+        )
+        return {key: json.loads(value) for key, value in rows}
+
+    def _purge(self, now: float) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            ).rowcount
+
+    async def purge_expired(self) -> int:
+        self._last_purge = time.monotonic()
+        return await asyncio.to_thread(self._purge, time.time())
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_state_store(default_ttl: Optional[float] = None) -> BaseStateStore:
+    """Build the store selected by STATE_STORE ('memory' or 'sqlite')"""
+    backend = os.getenv('STATE_STORE', 'memory').lower()
+    if backend == 'sqlite':
+        path = os.getenv('STATE_STORE_PATH', 'bot_state.sqlite3')
+        logger.info("💾 Using SQLite state store", extra={"path": path})
+        return SQLiteStateStore(path, default_ttl=default_ttl)
+    if backend == 'memory':
+        return MemoryStateStore(default_ttl=default_ttl)
+    raise ValueError(f"Unknown STATE_STORE '{backend}', expected 'memory' or 'sqlite'")
+
+
+class StateStorePersistence(BasePersistence):
+    """Persists ConversationHandler states in a state store; user/chat/bot data are not stored"""
+
+    def __init__(self, store: BaseStateStore, conversation_ttl: Optional[float] = None, update_interval: float = 5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+        self.conversation_ttl = conversation_ttl
+
+    @staticmethod
+    def _namespace(name: str) -> str:
+        return f"conversation:{name}"
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        stored = await self.store.items(self._namespace(name))
+        return {tuple(json.loads(key)): state for key, state in stored.items()}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        store_key = _encode(list(key))
+        if new_state is None:
+            await self.store.delete(self._namespace(name), store_key)
+        else:
+            await self.store.set(self._namespace(name), store_key, new_state, ttl=self.conversation_ttl)
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Any:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id: int, data: Any) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Any) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Nothing is buffered: every update_conversation call writes through to the store"""
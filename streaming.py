@@ -0,0 +1,67 @@
+import json
+from typing import Any, AsyncIterator, Dict, List
+import aiohttp
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+SSE_TYPE = "text/event-stream"
+
+# Sent with requests whose answer the backend may stream; a plain JSON answer still works
+ACCEPT_STREAMING = "application/x-ndjson, text/event-stream;q=0.9, application/json;q=0.5"
+
+
+class StreamError(Exception):
+    """The backend reported an error in the middle of a streamed answer"""
+
+
+def is_streaming(response: aiohttp.ClientResponse) -> bool:
+    return response.content_type in NDJSON_TYPES or response.content_type == SSE_TYPE
+
+
+async def iter_events(response: aiohttp.ClientResponse) -> AsyncIterator[Dict[str, Any]]:
+    """Decoded JSON events of a streamed response, as they arrive.
+
+    NDJSON: one JSON object per line. SSE: the ``data:`` lines of each event joined into one
+    JSON object; comments (keep-alives) are skipped and ``data: [DONE]`` ends the stream.
+    """
+    sse = response.content_type == SSE_TYPE
+    data: List[str] = []
+    async for raw in response.content:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not sse:
+            if line.strip():
+                yield json.loads(line)
+            continue
+        if line:
+            field, _, value = line.partition(":")
+            if field == "data":
+                data.append(value[1:] if value.startswith(" ") else value)
+            continue
+        # A blank line dispatches the event
+        if data:
+            payload, data = "\n".join(data), []
+            if payload == "[DONE]":
+                return
+            yield json.loads(payload)
+    if data and data != ["[DONE]"]:
+        yield json.loads("\n".join(data))
+
+
+async def iter_text(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+    """The answer streamed so far, after every event that changed it.
+
+    Events carry ``delta`` (text to append) or ``message`` (the whole text so far, e.g. the
+    final answer); ``error`` raises StreamError and ``done: true`` ends the stream.
+    """
+    text = ""
+    async for event in iter_events(response):
+        if event.get("error"):
+            raise StreamError(event["error"])
+        if "message" in event:
+            changed, text = event["message"] != text, event["message"]
+        else:
+            delta = event.get("delta") or ""
+            changed, text = bool(delta), text + delta
+        if changed:
+            yield text
+        if event.get("done"):
+            return
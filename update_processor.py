@@ -0,0 +1,187 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, Iterable, Optional, Set
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from bot_logging import bind, hash_user
+from cache import TTLCache
+from metrics import UPDATES_SKIPPED
+from state_store import BaseStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping updates from the same user in order.
+
+    Two limits apply:
+      * ``max_pending_updates`` bounds how many updates may be in the processor at once
+        (running or waiting for their user's earlier updates to finish).
+      * ``max_concurrent_updates`` bounds how many handlers actually run at the same time.
+
+    The per-user lock is taken *before* a running slot, so a user with a long backlog only
+    ever occupies one slot and cannot starve everyone else.
+
+    Updates are skipped before they take a slot when:
+      * their update_id was seen in the last ``dedup_window`` seconds (Telegram redelivers
+        updates after restarts, slow polling or webhook timeouts). With a persistent ``store``,
+        handled ids are also recorded there, so redeliveries after a restart are caught as well;
+        pass none for in-memory stores, which the window already covers.
+      * they repeat one of ``coalesce_commands`` (same user, same arguments) while an earlier
+        one is still pending or running: a double-tapped /balance or /upgrade gets the
+        first one's backend call and reply.
+    """
+
+    DEDUP_NAMESPACE = "handled_updates"
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        max_pending_updates: Optional[int] = None,
+        dedup_window: float = 600,
+        coalesce_commands: Iterable[str] = (),
+        store: Optional[BaseStateStore] = None,
+    ):
+        max_pending_updates = max(max_pending_updates or max_concurrent_updates * 4, max_concurrent_updates)
+        super().__init__(max_pending_updates)
+        self.max_running_updates = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        # user_id -> [lock, number of updates holding or waiting for it]
+        self._user_locks: Dict[Any, list] = {}
+        self.last_processed_at: Optional[float] = None  # time.monotonic() of the last finished update
+        self._tasks: Set[asyncio.Task] = set()  # Tasks of all updates currently in the processor
+        self.dedup_window = dedup_window
+        self._seen = TTLCache(max_entries=100000, ttl=dedup_window)  # update_id -> True
+        self.coalesce_commands = {command.lower() for command in coalesce_commands}
+        self._commands_in_flight: Set[Hashable] = set()
+        self.store = store
+        self.skipped: Dict[str, int] = {}  # reason -> updates skipped
+
+    @staticmethod
+    def ordering_key(update: object):
+        """Updates sharing this key are processed strictly in arrival order"""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+        return None
+
+    def command_key(self, update: object) -> Optional[Hashable]:
+        """(user, command, arguments) of a command message whose duplicates are coalesced"""
+        if not self.coalesce_commands or not isinstance(update, Update):
+            return None
+        message, user = update.message, update.effective_user
+        if not message or not user or not message.text or not message.text.startswith("/"):
+            return None
+        command, _, arguments = message.text.partition(" ")
+        name = command[1:].split("@", 1)[0].lower()
+        if name not in self.coalesce_commands:
+            return None
+        return (user.id, name, arguments.strip())
+
+    def _skip_reason(self, update: object, command_key: Optional[Hashable]) -> Optional[str]:
+        """Why the update is skipped, or None; a command that isn't skipped is now in flight.
+
+        Only in-memory checks: nothing may be awaited before the update is queued behind its
+        user's earlier updates, or they could overtake each other. See ``_handled_before``.
+        """
+        if not isinstance(update, Update):
+            return None
+        if update.update_id in self._seen:
+            return "duplicate"
+        if command_key in self._commands_in_flight:
+            return "coalesced"
+        self._seen.set(update.update_id, True)
+        if command_key is not None:
+            self._commands_in_flight.add(command_key)
+        return None
+
+    def _skip(self, update: Update, coroutine: Awaitable[Any], reason: str):
+        coroutine.close()
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        UPDATES_SKIPPED.labels(reason).inc()
+        logger.info("⏭️ Skipping update", extra={"reason": reason, "update_id": update.update_id})
+
+    async def _handled_before(self, update: object) -> bool:
+        """Whether the store recorded the update as handled, e.g. before a restart"""
+        return bool(
+            self.store and isinstance(update, Update)
+            and await self.store.get(self.DEDUP_NAMESPACE, str(update.update_id))
+        )
+
+    async def _record_handled(self, update: object):
+        if self.store and isinstance(update, Update):
+            await self.store.set(self.DEDUP_NAMESPACE, str(update.update_id), True, ttl=self.dedup_window)
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        command_key = self.command_key(update)
+        reason = self._skip_reason(update, command_key)
+        if reason:
+            self._skip(update, coroutine, reason)
+            if reason == "coalesced":
+                await self._record_handled(update)
+            return
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await super().process_update(update, coroutine)
+        except asyncio.CancelledError:
+            coroutine.close()  # Never started if the update was still waiting for a slot
+            raise
+        finally:
+            self._tasks.discard(task)
+            self._commands_in_flight.discard(command_key)
+
+    def cancel_all(self) -> int:
+        """Cancel every update still in the processor; returns how many were cancelled"""
+        tasks = [task for task in self._tasks if not task.done()]
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Each update is processed in its own task, so the log context stays per-update
+        if isinstance(update, Update):
+            user = update.effective_user
+            bind(update_id=update.update_id, user=hash_user(user.id) if user else None)
+        key = self.ordering_key(update)
+        if key is None:
+            if await self._handled_before(update):
+                self._skip(update, coroutine, "duplicate")
+                return
+            async with self._running:
+                try:
+                    await coroutine
+                finally:
+                    self.last_processed_at = time.monotonic()
+            await self._record_handled(update)
+            return
+
+        entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                # Looked up under the user's lock, so the await can't reorder the user's updates
+                if await self._handled_before(update):
+                    self._skip(update, coroutine, "duplicate")
+                    return
+                async with self._running:
+                    await coroutine
+        finally:
+            self.last_processed_at = time.monotonic()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[key]
+        # Recorded once handled: an update interrupted by a crash is processed when redelivered
+        await self._record_handled(update)
+
+    async def initialize(self) -> None:
+        """Nothing to allocate"""
+
+    async def shutdown(self) -> None:
+        self._user_locks.clear()
+        self._commands_in_flight.clear()
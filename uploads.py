@@ -0,0 +1,228 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Tuple, Union
+import aiohttp
+from telegram import File
+
+from backend_client import BackendClient
+from media import MediaStreamer
+from resilience import RetryPolicy
+from state_store import BaseStateStore
+
+logger = logging.getLogger(__name__)
+
+# on_progress(stage, fraction): stage is "uploading" (fraction of bytes sent) or "processing"
+ProgressCallback = Callable[[str, float], Awaitable[None]]
+
+
+class UploadError(Exception):
+    """The backend refused a statement upload; ``status`` 401 means the user isn't registered"""
+
+    def __init__(self, status: int, detail: str = ""):
+        super().__init__(f"Statement upload failed with HTTP {status}: {detail}")
+        self.status = status
+
+
+class UploadsUnsupported(UploadError):
+    """The backend has no statement-uploads endpoint (404/405); post the statement in one request"""
+
+
+class _Resync(Exception):
+    """The backend is at a different offset than we are; continue from ``offset``"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Backend expects offset {offset}")
+        self.offset = offset
+
+
+class _ChunkRejected(Exception):
+    """A chunk failed its checksum on the backend or hit a transient error; send it again"""
+
+
+async def _pieces(payload: Union[bytes, AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+    if isinstance(payload, bytes):
+        yield payload
+        return
+    async for piece in payload:
+        yield piece
+
+
+class ChunkedUploader:
+    """Uploads bank statements in checksummed chunks and resumes interrupted uploads.
+
+    Backend protocol, under /okanassist/v1:
+
+      POST statement-uploads                 {user_id, file_name, size} -> {upload_id}
+      GET  statement-uploads/<id>            -> {offset, status: uploading|processing|done|failed, message}
+      PUT  statement-uploads/<id>/chunks?offset=<n>
+                                             raw bytes with X-Chunk-SHA256 -> {offset}; 409 {offset}
+                                             if the backend is elsewhere, 422 on a checksum mismatch
+      POST statement-uploads/<id>/complete   {user_id, size, sha256} -> 200 {message}, or 202 and
+                                             the result is polled from the status endpoint
+
+    The upload id is kept in the state store per (user, file), so a retried or resent upload
+    continues from the backend's offset instead of starting over.
+    """
+
+    NAMESPACE = "statement_upload"
+
+    def __init__(self, backend: BackendClient, media: MediaStreamer, store: BaseStateStore):
+        self.backend = backend
+        self.media = media
+        self.store = store
+        self.chunk_size = int(os.getenv('STATEMENT_CHUNK_BYTES', 1024 * 1024))
+        self.max_retries = int(os.getenv('STATEMENT_UPLOAD_RETRIES', 5))
+        self.poll_interval = float(os.getenv('STATEMENT_POLL_INTERVAL', 5))
+        self.import_timeout = float(os.getenv('STATEMENT_IMPORT_TIMEOUT', 30 * 60))
+        self.session_ttl = float(os.getenv('STATEMENT_UPLOAD_TTL', 24 * 3600))
+        self.retry_policy = RetryPolicy(base_delay=1.0, max_delay=30.0)
+
+    @staticmethod
+    def _path(upload_id: str, action: str = "") -> str:
+        return f"statement-uploads/{upload_id}/{action}".rstrip('/')
+
+    async def _status(self, upload_id: str) -> Tuple[int, Dict[str, Any]]:
+        return await self.backend.fetch_json("GET", "statement-upload-status", path=self._path(upload_id))
+
+    async def _open(self, user_id: str, file_name: str, size: int, resume_key: str) -> Tuple[str, Dict[str, Any]]:
+        """Upload id and backend status of the upload to continue, creating one if needed"""
+        stored = await self.store.get(self.NAMESPACE, resume_key)
+        if stored:
+            status, body = await self._status(stored["upload_id"])
+            if status == 200 and body.get("status") != "failed":
+                logger.info("⏯️ Resuming statement upload", extra={"offset": body.get("offset", 0)})
+                return stored["upload_id"], body
+
+        status, body = await self.backend.fetch_json(
+            "POST", "statement-upload-create", path="statement-uploads",
+            json={"user_id": user_id, "file_name": file_name, "size": size},
+        )
+        if status in (404, 405):
+            raise UploadsUnsupported(status, body.get("detail", ""))
+        if status not in (200, 201):
+            raise UploadError(status, body.get("detail", ""))
+        await self.store.set(self.NAMESPACE, resume_key, {"upload_id": body["upload_id"]}, ttl=self.session_ttl)
+        return body["upload_id"], {"offset": 0, "status": "uploading"}
+
+    async def _put_chunk(self, upload_id: str, offset: int, chunk: bytes) -> int:
+        status, body = await self.backend.fetch_json(
+            "PUT", "statement-upload-chunk", path=self._path(upload_id, "chunks"),
+            params={"offset": offset},
+            data=chunk,
+            headers={
+                "Content-Type": "application/octet-stream",
+                "X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest(),
+            },
+        )
+        if status == 200:
+            if int(body["offset"]) != offset + len(chunk):
+                raise _Resync(int(body["offset"]))
+            return offset + len(chunk)
+        if status == 409:
+            raise _Resync(int(body["offset"]))
+        if status == 422 or status >= 500:
+            raise _ChunkRejected(f"HTTP {status}")
+        raise UploadError(status, body.get("detail", ""))
+
+    async def _send_from(
+        self, file: File, upload_id: str, offset: int, size: int, on_progress: ProgressCallback
+    ) -> str:
+        """Read the file from the start, upload everything from ``offset`` on, return its sha256.
+
+        Bytes before ``offset`` are only hashed: the backend already has them.
+        """
+        digest = hashlib.sha256()
+        position = 0
+        buffer = bytearray()
+        async with self.media.open(file, kind="statement") as payload:
+            async for piece in _pieces(payload):
+                digest.update(piece)
+                skip = max(0, offset + len(buffer) - position)
+                position += len(piece)
+                if skip < len(piece):
+                    buffer += piece[skip:]
+                while len(buffer) >= self.chunk_size:
+                    offset = await self._put_chunk(upload_id, offset, bytes(buffer[:self.chunk_size]))
+                    del buffer[:self.chunk_size]
+                    await on_progress("uploading", offset / size if size else 0.0)
+        if buffer:
+            offset = await self._put_chunk(upload_id, offset, bytes(buffer))
+            await on_progress("uploading", 1.0)
+        return digest.hexdigest()
+
+    async def _complete(self, upload_id: str, user_id: str, size: int, sha256: str) -> Dict[str, Any]:
+        status, body = await self.backend.fetch_json(
+            "POST", "statement-upload-complete", path=self._path(upload_id, "complete"),
+            json={"user_id": user_id, "size": size, "sha256": sha256},
+        )
+        if status == 200 and "message" in body:
+            return body
+        if status not in (200, 202):
+            raise UploadError(status, body.get("detail", ""))
+        return await self._wait_for_import(upload_id)
+
+    async def _wait_for_import(self, upload_id: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.import_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            status, body = await self._status(upload_id)
+            if status >= 500:
+                continue  # Already retried by the endpoint's policy; keep polling until the deadline
+            if status != 200:
+                raise UploadError(status, body.get("detail", ""))
+            if body.get("status") == "done":
+                return body
+            if body.get("status") == "failed":
+                raise UploadError(422, body.get("detail", "import failed"))
+        raise UploadError(504, "import did not finish in time")
+
+    async def upload(
+        self, file: File, user_id: str, file_name: str, resume_key: str, on_progress: ProgressCallback
+    ) -> Dict[str, Any]:
+        """Upload ``file``, run the import and return the backend's final body (with ``message``)"""
+        size = file.file_size or 0
+        upload_id, state = await self._open(user_id, file_name, size, resume_key)
+        if state.get("status") == "done":
+            await self.store.delete(self.NAMESPACE, resume_key)
+            return state
+        if state.get("status") == "processing":
+            await on_progress("processing", 1.0)
+            result = await self._wait_for_import(upload_id)
+            await self.store.delete(self.NAMESPACE, resume_key)
+            return result
+
+        offset = int(state.get("offset", 0))
+        failures = 0
+        while True:
+            try:
+                sha256 = await self._send_from(file, upload_id, offset, size, on_progress)
+                break
+            except (_Resync, _ChunkRejected, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, _Resync):
+                    resume_at = e.offset
+                else:
+                    await asyncio.sleep(self.retry_policy.backoff(failures))
+                    status, body = await self._status(upload_id)
+                    if status != 200:
+                        raise UploadError(status, body.get("detail", ""))
+                    resume_at = int(body.get("offset", 0))
+                # Only interruptions without progress in between count towards the limit
+                failures = 1 if resume_at > offset else failures + 1
+                if failures > self.max_retries:
+                    raise
+                logger.warning("⚠️ Statement upload interrupted, resuming: %s", e, extra={"offset": resume_at})
+                offset = resume_at
+
+        await on_progress("processing", 1.0)
+        try:
+            result = await self._complete(upload_id, user_id, size, sha256)
+        except UploadError as e:
+            if e.status != 504:
+                # Rejected as a whole (e.g. checksum mismatch): a resend starts a fresh upload
+                await self.store.delete(self.NAMESPACE, resume_key)
+            raise
+        await self.store.delete(self.NAMESPACE, resume_key)
+        return result
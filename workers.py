@@ -0,0 +1,205 @@
+import os
+import time
+import queue
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from typing import Any, Dict, Iterable, List, Optional
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.metrics_core import Metric
+from prometheus_client.parser import text_string_to_metric_families
+
+logger = logging.getLogger(__name__)
+
+_STOP = None  # Sentinel on a worker's update queue: drain and exit
+
+
+def shard_key(payload: Dict[str, Any]) -> int:
+    """User id of a raw Bot API update (chat id if it has no user, 0 if neither).
+
+    Mirrors ``Update.effective_user``/``effective_chat`` closely enough for sharding: every
+    update type that carries a user keeps it in ``from`` (or ``user``) of its payload object.
+    """
+    for value in payload.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return int(user["id"])
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return int(chat["id"])
+    return 0
+
+
+class WorkerPool:
+    """Runs BOT_WORKERS processes that each handle the updates of a fixed subset of users.
+
+    Updates are sharded by ``user_id % count``, so one user's conversation state, registration
+    data and cached responses always live in the same worker. Workers push their metrics to
+    the ingress every WORKER_METRICS_INTERVAL seconds; /metrics on the ingress serves them
+    merged, labelled with ``worker``.
+    """
+
+    def __init__(self, count: int, shutdown_grace_period: float = 10):
+        self.count = count
+        # Workers must be done (drained and exited) within this many seconds of being asked to stop
+        self.shutdown_grace_period = shutdown_grace_period
+        self.metrics_interval = float(os.getenv('WORKER_METRICS_INTERVAL', 5))
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue() for _ in range(count)]
+        self._metrics_queue = self._context.Queue()
+        self._processes: List[multiprocessing.Process] = []
+        self._snapshots: Dict[int, str] = {}
+        self._stopping = False
+        self._collector_thread: Optional[threading.Thread] = None
+
+    def _worker_env(self) -> Dict[str, str]:
+        # The global Bot API budget is shared, so each worker gets an equal slice of it
+        overall_rate = float(os.getenv('TELEGRAM_OVERALL_RATE', 30))
+        return {
+            "TELEGRAM_OVERALL_RATE": str(overall_rate / self.count),
+            "SHUTDOWN_GRACE_PERIOD": str(self.shutdown_grace_period),
+        }
+
+    def start(self):
+        for index in range(self.count):
+            process = self._context.Process(
+                target=worker_main,
+                args=(
+                    index, self._queues[index], self._metrics_queue,
+                    {**self._worker_env(), "BOT_WORKER_INDEX": str(index)}, self.metrics_interval,
+                ),
+                name=f"bot-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        self._collector_thread = threading.Thread(target=self._collect_snapshots, name="WorkerMetrics", daemon=True)
+        self._collector_thread.start()
+        logger.info("👷 Started %d worker processes", self.count)
+
+    def _collect_snapshots(self):
+        while True:
+            item = self._metrics_queue.get()
+            if item is _STOP:
+                return
+            index, text = item
+            self._snapshots[index] = text
+
+    def dispatch(self, payload: Dict[str, Any], key: Optional[int] = None):
+        """Queue a raw update for the worker that owns its user; never blocks"""
+        key = shard_key(payload) if key is None else key
+        self._queues[key % self.count].put_nowait(payload)
+
+    def status(self) -> List[Dict[str, Any]]:
+        result = []
+        for index, process in enumerate(self._processes):
+            try:
+                backlog: Optional[int] = self._queues[index].qsize()
+            except NotImplementedError:  # macOS
+                backlog = None
+            result.append({"worker": index, "alive": process.is_alive(), "queued_updates": backlog})
+        return result
+
+    def dead_workers(self) -> List[int]:
+        if self._stopping:
+            return []
+        return [index for index, process in enumerate(self._processes) if not process.is_alive()]
+
+    def request_stop(self):
+        """Ask every worker to drain and exit, without waiting; updates dispatched after this are lost"""
+        if self._stopping:
+            return
+        self._stopping = True
+        for updates in self._queues:
+            updates.put(_STOP)
+
+    async def stop(self, timeout: float):
+        """Ask every worker to drain and exit; kill those still running after ``timeout``"""
+        self.request_stop()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("⏱️ Worker %s did not stop in time, terminating it", process.name)
+                process.terminate()
+        self._metrics_queue.put(_STOP)
+
+    def collect(self) -> Iterable[Metric]:
+        """This process's metrics merged with the latest snapshot of every worker"""
+        merged: Dict[str, Metric] = {}
+
+        def add(families: Iterable[Metric], worker: str):
+            for family in families:
+                target = merged.get(family.name)
+                if target is None:
+                    target = merged[family.name] = Metric(family.name, family.documentation, family.type)
+                for sample in family.samples:
+                    target.add_sample(sample.name, {**sample.labels, "worker": worker}, sample.value, sample.timestamp)
+
+        add(REGISTRY.collect(), "ingress")
+        for index, text in sorted(self._snapshots.items()):
+            add(text_string_to_metric_families(text), str(index))
+        return merged.values()
+
+    async def metrics_endpoint(self, request: web.Request) -> web.Response:
+        return web.Response(body=generate_latest(self), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def worker_main(index: int, updates, metrics_queue, env: Dict[str, str], metrics_interval: float):
+    """Entry point of a worker process"""
+    os.environ.update(env)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group; the ingress coordinates
+    from bot_logging import bind, configure_logging
+
+    configure_logging()
+    bind(worker=index)
+    asyncio.run(_run_worker(index, updates, metrics_queue, metrics_interval))
+
+
+async def _run_worker(index: int, updates, metrics_queue, metrics_interval: float):
+    from bot_handler import AgnoTelegramBot
+    from telegram import Update
+
+    bot = AgnoTelegramBot(role="worker")
+    bot.setup()
+    await bot.start_components()
+    bot.health.loop_lag.start()
+
+    loop = asyncio.get_running_loop()
+    stop_requested = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop_requested.set)
+
+    def enqueue(payload: Dict[str, Any]):
+        bot.app.update_queue.put_nowait(Update.de_json(payload, bot.app.bot))
+
+    def read_updates():
+        while True:
+            payload = updates.get()
+            if payload is _STOP:
+                loop.call_soon_threadsafe(stop_requested.set)
+                return
+            loop.call_soon_threadsafe(enqueue, payload)
+
+    async def push_metrics():
+        while True:
+            try:
+                metrics_queue.put_nowait((index, generate_latest(REGISTRY).decode()))
+            except queue.Full:
+                pass
+            await asyncio.sleep(metrics_interval)
+
+    threading.Thread(target=read_updates, name="WorkerUpdates", daemon=True).start()
+    pusher = asyncio.create_task(push_metrics())
+    logger.info("👷 Worker ready", extra={"pid": os.getpid()})
+    try:
+        await stop_requested.wait()
+        await bot.drain()
+    finally:
+        pusher.cancel()
+        await bot.health.loop_lag.stop()
+        await bot.stop_components()